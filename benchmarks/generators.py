@@ -0,0 +1,92 @@
+"""Synthetic schemas and matching data for the benchmarks.
+
+Every generator takes a rough number of leaves and returns ``(schema, data)``
+with the data valid against the schema. The shapes stress different parts
+of the library:
+
+* wide: one dict with a literal key, and its own sub-schema, per leaf
+* deep: chains of nested literal-keyed dicts, 20 levels deep
+* list: lists of scalars and lists of small dicts under ``str`` keys
+* pattern: sections matched by ``And(str, ...)`` and plain ``str`` keys, with
+  constrained values
+"""
+
+from schema import And, Optional, Or
+
+DEPTH = 20
+LIST_LENGTH = 50
+
+
+def wide(leaves):
+    schema = {f"field{i}": Or(int, None) for i in range(leaves)}
+    data = {f"field{i}": i for i in range(leaves)}
+    return schema, data
+
+
+def deep(leaves):
+    level = {"value": int}
+    chain = {"value": 0}
+    for depth in range(1, DEPTH):
+        level = {"value": int, Optional("next"): level}
+        chain = {"value": depth, "next": chain}
+    schema = {str: level}
+    data = {f"chain{i}": chain for i in range(max(1, leaves // DEPTH))}
+    return schema, _copy(data)
+
+
+def lists(leaves):
+    sections = max(1, leaves // (LIST_LENGTH * 3))
+    schema = {
+        "numbers": {str: [int]},
+        "records": {str: [{"name": str, "value": int}]},
+    }
+    data = {
+        "numbers": {f"list{s}": list(range(LIST_LENGTH)) for s in range(sections)},
+        "records": {
+            f"list{s}": [{"name": f"item{i}", "value": i} for i in range(LIST_LENGTH)]
+            for s in range(sections)
+        },
+    }
+    return schema, data
+
+
+def pattern(leaves):
+    server = {
+        "host": And(str, len),
+        "port": And(int, lambda port: 0 < port < 65536),
+        Optional("enabled"): bool,
+    }
+    schema = {
+        And(str, lambda key: key.startswith("server")): server,
+        str: {"path": str, "size": And(int, lambda size: size >= 0)},
+    }
+    data = {}
+    for i in range(max(1, leaves // 5)):
+        data[f"server{i}"] = {"host": f"host{i}", "port": 1024 + i, "enabled": True}
+        data[f"volume{i}"] = {"path": f"/srv/{i}", "size": i}
+    return schema, data
+
+
+def _copy(value):
+    # The deep chains are shared above; nodes expect a tree
+    if isinstance(value, dict):
+        return {key: _copy(item) for key, item in value.items()}
+    return value
+
+
+SHAPES = {"wide": wide, "deep": deep, "list": lists, "pattern": pattern}
+
+
+def first_int_leaf(data, path=()):
+    """Return the key path of the first integer leaf in ``data``, for edits."""
+    if isinstance(data, dict):
+        items = data.items()
+    elif isinstance(data, list):
+        items = enumerate(data)
+    else:
+        return path if type(data) is int else None
+    for key, value in items:
+        found = first_int_leaf(value, path + (key,))
+        if found is not None:
+            return found
+    return None
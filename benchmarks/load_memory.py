@@ -0,0 +1,100 @@
+"""Measure peak memory and time for loading and validating a settings file.
+
+"safe_load" parses the whole document with ``yaml.safe_load`` (libyaml
+where available) and then validates it, as from_yaml used to; "streaming"
+is YamlSerializer.load_validated, which validates as it parses; "json"
+loads the same data from JSON through an mmap (with orjson installed). The
+documents are the ones from benchmarks/startup.py. Each load is timed, then
+run again under tracemalloc to find its peak memory use; "data" is the size
+of the loaded data on its own.
+
+Usage::
+
+    python benchmarks/load_memory.py [1 5]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+import yaml  # noqa: E402
+from startup import SCHEMA, make_document  # noqa: E402
+
+from togax_settings.compiled import compile_schema  # noqa: E402
+from togax_settings.serializers import (  # noqa: E402
+    CSafeLoader,
+    JsonSerializer,
+    YamlSerializer,
+)
+
+
+def safe_load(path):
+    with open(path, "rb") as file:
+        data = yaml.load(file, Loader=CSafeLoader)
+    compile_schema(SCHEMA)(data)
+    return data
+
+
+def streaming(path):
+    with open(path, "rb") as file:
+        return YamlSerializer().load_validated(file, SCHEMA)
+
+
+def json_mmap(path):
+    with open(path, "rb") as file:
+        data = JsonSerializer().load(file)
+    compile_schema(SCHEMA)(data)
+    return data
+
+
+def measure(load, path):
+    start = time.perf_counter()
+    load(path)
+    elapsed = time.perf_counter() - start
+
+    tracemalloc.start()
+    data = load(path)
+    size, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del data
+    return elapsed, size / 2**20, peak / 2**20
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("megabytes", nargs="*", type=float, default=[1])
+    args = parser.parse_args()
+
+    print(f"{'MB':>6} {'loader':>10} {'seconds':>8} {'data MiB':>9} {'peak MiB':>9}")
+    with tempfile.TemporaryDirectory() as directory:
+        for megabytes in args.megabytes:
+            data = make_document(megabytes)
+            path = os.path.join(directory, "settings.yaml")
+            with open(path, "w") as file:
+                yaml.dump(data, file, Dumper=yaml.CDumper)
+            json_path = os.path.join(directory, "settings.json")
+            with open(json_path, "wb") as file:
+                file.write(JsonSerializer().dump(data))
+            del data
+
+            size = os.path.getsize(path) / 2**20
+            for name, load, source in (
+                ("safe_load", safe_load, path),
+                ("streaming", streaming, path),
+                ("json", json_mmap, json_path),
+            ):
+                elapsed, data_size, peak = measure(load, source)
+                print(
+                    f"{size:>6.1f} {name:>10} {elapsed:>8.2f} {data_size:>9.1f}"
+                    f" {peak:>9.1f}"
+                )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+"""Measure the memory held by node trees with tracemalloc.
+
+The document is ``leaves // 4`` records under a ``str`` pattern key, each with
+a host, a port and a two-item list of tags, so most nodes share a sub-schema
+with their siblings. The parsed data is allocated before tracing starts, so
+the figures only cover the nodes themselves.
+
+``--before`` also measures the layout nodes had before they were slotted:
+toga Sources with a ``__dict__`` each, every node holding its own schema, key
+schema, validators and schema path.
+
+Usage::
+
+    python benchmarks/node_memory.py [--before] [10000 100000 ...]
+"""
+
+import argparse
+import gc
+import sys
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+from toga.sources import Source  # noqa: E402
+
+from togax_settings.compiled import compile_validator, key_dispatch  # noqa: E402
+from togax_settings.nodes import create_node  # noqa: E402
+
+
+def make_document(leaves):
+    schema = {str: {"host": str, "port": int, "tags": [str]}}
+    data = {
+        f"server{i}": {"host": f"host{i}", "port": i, "tags": ["a", "b"]}
+        for i in range(max(1, leaves // 4))
+    }
+    return schema, data
+
+
+class _LegacyNode(Source):
+    # The layout nodes had before they were slotted and shared a SchemaInfo
+    def __init__(
+        self, key, value, parent=None, keyschema=None, schema=None, schema_key=None
+    ):
+        super().__init__()
+        self.key = key
+        self.value = value
+        self.parent = parent
+        self.lazy = False if parent is None else parent.lazy
+        self._children = []
+        self.keyschema = keyschema
+        self.key_validator = compile_validator(keyschema)
+        self.schema = schema
+        self.validator = compile_validator(schema)
+        if parent is None:
+            self.path = ()
+        elif isinstance(parent.schema, dict):
+            self.path = parent.path + (key if schema_key is None else schema_key,)
+        elif isinstance(parent.schema, list):
+            self.path = parent.path + (0,)
+        else:
+            self.path = parent.path
+        if isinstance(value, dict):
+            for child_key, child_value in value.items():
+                schema_key, child_keyschema, child_schema = (None, None, None)
+                if isinstance(schema, dict):
+                    schema_key, child_keyschema, child_schema = key_dispatch(
+                        schema
+                    ).resolve(child_key)
+                self._children.append(
+                    _LegacyNode(
+                        child_key,
+                        child_value,
+                        self,
+                        child_keyschema,
+                        child_schema,
+                        schema_key,
+                    )
+                )
+        elif isinstance(value, list):
+            item_schema = schema[0] if isinstance(schema, list) and schema else None
+            for index, item in enumerate(value):
+                self._children.append(
+                    _LegacyNode(index, item, self, schema=item_schema)
+                )
+
+    @property
+    def children(self):
+        return self._children
+
+
+def count_nodes(node):
+    return 1 + sum(count_nodes(child) for child in node.children)
+
+
+def measure(leaves, build=create_node):
+    schema, data = make_document(leaves)
+    gc.collect()
+    tracemalloc.start()
+    root = build("root", data, schema=schema)
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return count_nodes(root), size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("leaves", nargs="*", type=int, default=[10**4, 10**5])
+    parser.add_argument(
+        "--before",
+        action="store_true",
+        help="also measure the previous unslotted, per-node schema layout",
+    )
+    args = parser.parse_args()
+
+    header = f"{'leaves':>10} {'nodes':>10} {'after MiB':>10} {'bytes/node':>11}"
+    if args.before:
+        header += f" {'before MiB':>11} {'bytes/node':>11} {'saved':>6}"
+    print(header)
+    for leaves in args.leaves:
+        nodes, size = measure(leaves)
+        row = f"{leaves:>10} {nodes:>10} {size / 2**20:>10.1f} {size / nodes:>11.0f}"
+        if args.before:
+            _, before = measure(leaves, _LegacyNode)
+            row += (
+                f" {before / 2**20:>11.1f} {before / nodes:>11.0f}"
+                f" {1 - size / before:>6.0%}"
+            )
+        print(row)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""Time loading a settings file with and without a snapshot.
+
+Each document has records under a ``str`` pattern key, like
+benchmarks/yaml_io.py, checked against a schema with a few constraints.
+With ``--wide N`` the records instead have N literal keys each (a quarter
+of them optional), which stresses matching keys against a wide schema.
+"cold" is from_yaml without a snapshot (parse and validate), "first" is the
+first load with snapshot=True (the same work plus writing the snapshot), and
+"warm" is a load that is served from the snapshot. Nodes are built lazily so
+the figures are dominated by getting the data in.
+
+Usage::
+
+    python benchmarks/startup.py [1 10 100] [--wide 1000]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+import yaml  # noqa: E402
+from schema import And, Optional  # noqa: E402
+
+from togax_settings.schema_source import SchemaDataSource  # noqa: E402
+
+# Roughly the size of one record below once dumped
+RECORD_BYTES = 105
+
+SCHEMA = {
+    str: {
+        "host": str,
+        "port": And(int, lambda port: 0 < port < 65536),
+        "timeout": float,
+        "enabled": bool,
+        Optional("tags"): [str],
+    }
+}
+
+
+def make_document(megabytes):
+    return {
+        f"server{i}": {
+            "host": f"host{i}.example.com",
+            "port": 1024 + i % 50000,
+            "timeout": 2.5,
+            "enabled": i % 3 == 0,
+            "tags": ["alpha", "beta"],
+        }
+        for i in range(int(megabytes * 2**20 / RECORD_BYTES))
+    }
+
+
+def wide_schema(keys):
+    return {
+        str: {
+            (Optional(f"option{i}") if i % 4 == 0 else f"option{i}"): int
+            for i in range(keys)
+        }
+    }
+
+
+def make_wide_document(megabytes, keys):
+    # Each key and value takes about 16 bytes once dumped
+    records = max(1, int(megabytes * 2**20 / (16 * keys)))
+    return {
+        f"record{r}": {f"option{i}": r + i for i in range(keys)} for r in range(records)
+    }
+
+
+def timed_load(path, schema, snapshot):
+    start = time.perf_counter()
+    SchemaDataSource.from_yaml("bench", path, schema, lazy=True, snapshot=snapshot)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("megabytes", nargs="*", type=float, default=[1, 10, 100])
+    parser.add_argument(
+        "--wide", type=int, metavar="N", help="records with N literal keys each"
+    )
+    args = parser.parse_args()
+    schema = wide_schema(args.wide) if args.wide else SCHEMA
+
+    print(f"{'MB':>8} {'cold s':>9} {'first s':>9} {'warm s':>9} {'speedup':>8}")
+    with tempfile.TemporaryDirectory() as directory:
+        for megabytes in args.megabytes:
+            path = os.path.join(directory, f"settings{megabytes}.yaml")
+            if args.wide:
+                document = make_wide_document(megabytes, args.wide)
+            else:
+                document = make_document(megabytes)
+            with open(path, "w") as file:
+                yaml.dump(document, file, Dumper=yaml.CDumper)
+
+            cold = timed_load(path, schema, snapshot=False)
+            first = timed_load(path, schema, snapshot=True)
+            warm = timed_load(path, schema, snapshot=True)
+            size = os.path.getsize(path) / 2**20
+            print(
+                f"{size:>8.1f} {cold:>9.2f} {first:>9.2f} {warm:>9.2f}"
+                f" {cold / warm:>7.1f}x"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,220 @@
+"""Benchmark the settings pipeline end to end on synthetic documents.
+
+For each shape in benchmarks/generators.py and each size, this times:
+
+* load: SchemaDataSource.from_yaml on the dumped document
+* build: building the node tree from already loaded data
+* to_dict: copying the data back out of the tree
+* save: save_to_yaml, validating and writing the whole document
+* edit: one leaf edited through SchemaNodeWidget.on_value_change, including
+  the save it triggers
+* tree: constructing a SettingsTree, under the toga-dummy backend
+
+Each figure is the best of ``--repeat`` runs. The results are written as
+JSON (to stdout, or ``--output``) along with the commit and Python version,
+and two such files can be compared with ``--compare``.
+
+Usage::
+
+    python benchmarks/suite.py [--shape wide --shape deep] [100 1000] \\
+        [--output results.json]
+    python benchmarks/suite.py --compare before.json after.json
+"""
+
+import argparse
+import gc
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+os.environ.setdefault("TOGA_BACKEND", "toga_dummy")
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+sys.path.insert(0, str(Path(__file__).parent))
+
+import toga  # noqa: E402
+import yaml  # noqa: E402
+from generators import SHAPES, first_int_leaf  # noqa: E402
+
+from togax_settings.schema_source import SchemaDataSource  # noqa: E402
+from togax_settings.settings import SchemaNodeWidget, SettingsTree  # noqa: E402
+
+METRICS = ["load", "build", "to_dict", "save", "edit", "tree"]
+
+
+def best(function, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def count_nodes(node):
+    return 1 + sum(count_nodes(child) for child in node.children)
+
+
+def reset_backend():
+    # The dummy backend logs every widget it creates, which keeps them all
+    # alive and makes the garbage collector slower with every case
+    if os.environ["TOGA_BACKEND"] == "toga_dummy":
+        from toga_dummy.utils import EventLog
+
+        EventLog.reset()
+    gc.collect()
+
+
+def run_case(shape, leaves, repeat, tree_limit, directory):
+    reset_backend()
+    schema, data = SHAPES[shape](leaves)
+    path = os.path.join(directory, f"{shape}-{leaves}.yaml")
+    with open(path, "w") as file:
+        yaml.dump(data, file)
+
+    results = {}
+    results["load"] = best(
+        lambda: SchemaDataSource.from_yaml("bench", path, schema), repeat
+    )
+    with open(path) as file:
+        loaded = yaml.safe_load(file)
+    results["build"] = best(
+        lambda: SchemaDataSource("bench", loaded, schema, path), repeat
+    )
+    source = SchemaDataSource.from_yaml("bench", path, schema)
+    results["to_dict"] = best(source.to_dict, repeat)
+    results["save"] = best(source.save_to_yaml, repeat)
+
+    leaf = source
+    for key in first_int_leaf(source.value):
+        leaf = leaf.child(key)
+    widget = SchemaNodeWidget(source, leaf)
+    values = iter(range(leaf.value + 1, leaf.value + 1 + repeat))
+
+    def edit():
+        # Set the widget without firing its handler, then time the handler
+        widget._binding = True
+        widget.value_widget.value = next(values)
+        widget._binding = False
+        start = time.perf_counter()
+        widget.on_value_change(widget.value_widget, is_key=False)
+        return time.perf_counter() - start
+
+    results["edit"] = min(edit() for _ in range(repeat))
+
+    nodes = count_nodes(source)
+    if nodes <= tree_limit:
+        results["tree"] = best(lambda: SettingsTree(source).teardown(), repeat)
+
+    return [
+        {
+            "shape": shape,
+            "leaves": leaves,
+            "nodes": nodes,
+            "metric": metric,
+            "seconds": results[metric],
+        }
+        for metric in METRICS
+        if metric in results
+    ]
+
+
+def describe():
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            cwd=Path(__file__).parent,
+        ).stdout.strip()
+    except OSError:
+        commit = ""
+    return {
+        "commit": commit or None,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+    }
+
+
+def compare(before_file, after_file):
+    with open(before_file) as file:
+        before = json.load(file)
+    with open(after_file) as file:
+        after = json.load(file)
+
+    def key(result):
+        return result["shape"], result["leaves"], result["metric"]
+
+    old = {key(result): result["seconds"] for result in before["results"]}
+    print(f"{before['meta']['commit']} -> {after['meta']['commit']}")
+    print(
+        f"{'shape':>8} {'leaves':>8} {'metric':>8} {'before':>10} {'after':>10} {'ratio':>7}"
+    )
+    for result in after["results"]:
+        if key(result) not in old:
+            continue
+        was = old[key(result)]
+        ratio = result["seconds"] / was if was else float("inf")
+        print(
+            f"{result['shape']:>8} {result['leaves']:>8} {result['metric']:>8} "
+            f"{was:>10.4f} {result['seconds']:>10.4f} {ratio:>7.2f}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("leaves", nargs="*", type=int, default=[100, 1000])
+    parser.add_argument(
+        "--shape", action="append", choices=sorted(SHAPES), help="default: all"
+    )
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument(
+        "--tree-limit",
+        type=int,
+        default=2000,
+        help="skip SettingsTree construction above this many nodes",
+    )
+    parser.add_argument("--output", help="write the JSON results here")
+    parser.add_argument(
+        "--compare", nargs=2, metavar=("BEFORE", "AFTER"), help="compare two results"
+    )
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    app = toga.App("Settings benchmarks", "org.togax_settings.benchmarks")
+    results = []
+
+    async def run():
+        with tempfile.TemporaryDirectory() as directory:
+            for shape in args.shape or list(SHAPES):
+                for leaves in args.leaves:
+                    for result in run_case(
+                        shape, leaves, args.repeat, args.tree_limit, directory
+                    ):
+                        print(
+                            f"{shape:>8} {leaves:>8} {result['metric']:>8} "
+                            f"{result['seconds']:>10.4f}",
+                            file=sys.stderr,
+                        )
+                        results.append(result)
+
+    app.loop.run_until_complete(run())
+
+    output = json.dumps({"meta": describe(), "results": results}, indent=2)
+    if args.output:
+        with open(args.output, "w") as file:
+            file.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""Time building a node tree for documents with wide, literal-keyed schemas.
+
+Each document holds ``leaves // width`` sections under a ``str`` pattern key,
+and every section has ``width`` literal fields, each with its own sub-schema.
+Before schema keys were passed down from DictNode._get_child_schemas, every
+node scanned its parent's schema to find its own path, making the build
+O(leaves * width).
+
+Usage::
+
+    python benchmarks/tree_build.py [--width 100] [--before] 10000 100000
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+from schema import Or  # noqa: E402
+
+from togax_settings.nodes import SchemaInfo, create_node  # noqa: E402
+
+
+def make_document(leaves, width):
+    fields = [f"field{i}" for i in range(width)]
+    schema = {str: {field: Or(int, None) for field in fields}}
+    data = {
+        f"section{s}": {field: s for field in fields}
+        for s in range(max(1, leaves // width))
+    }
+    return schema, data
+
+
+def _legacy_child(self, parent_key, schema_key, keyschema, schema):
+    # Find the schema key by the linear scan _construct_path used to do before
+    # schema keys were passed in
+    if isinstance(self.schema, dict):
+        for schema_key, schema_value in self.schema.items():
+            if schema_value == schema:
+                break
+        else:
+            schema_key = None
+    return _child(self, parent_key, schema_key, keyschema, schema)
+
+
+_child = SchemaInfo.child
+
+
+def time_build(schema, data):
+    start = time.perf_counter()
+    create_node("root", data, schema=schema)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("leaves", nargs="*", type=int, default=[10**4, 10**5, 10**6])
+    parser.add_argument("--width", type=int, default=100)
+    parser.add_argument(
+        "--before",
+        action="store_true",
+        help="also time the previous linear-scan path construction",
+    )
+    args = parser.parse_args()
+
+    print(f"{'leaves':>10} {'after (s)':>10} {'before (s)':>11}")
+    for leaves in args.leaves:
+        schema, data = make_document(leaves, args.width)
+        after = time_build(schema, data)
+        before = ""
+        if args.before:
+            SchemaInfo.child = _legacy_child
+            try:
+                before = f"{time_build(schema, data):.3f}"
+            finally:
+                SchemaInfo.child = _child
+        print(f"{leaves:>10} {after:>10.3f} {before:>11}")
+
+
+if __name__ == "__main__":
+    main()
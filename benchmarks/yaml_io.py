@@ -0,0 +1,77 @@
+"""Compare YAML load and save throughput with and without libyaml.
+
+Documents are generated to roughly the requested sizes in MB: records under a
+``str`` pattern key, each with a few strings, numbers, a flag and a short
+list, which is what large settings files tend to look like. "save" is
+YamlSerializer.dump, i.e. what SchemaDataSource.save_to_yaml writes, and the
+benchmark checks that both implementations produce the same bytes.
+
+Usage::
+
+    python benchmarks/yaml_io.py [1 10 100]
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+from togax_settings.serializers import LIBYAML, YamlSerializer  # noqa: E402
+
+# Roughly the size of one record below once dumped
+RECORD_BYTES = 105
+
+
+def make_document(megabytes):
+    return {
+        f"server{i}": {
+            "host": f"host{i}.example.com",
+            "port": 1024 + i % 50000,
+            "timeout": 2.5,
+            "enabled": i % 3 == 0,
+            "tags": ["alpha", "beta"],
+        }
+        for i in range(int(megabytes * 2**20 / RECORD_BYTES))
+    }
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return time.perf_counter() - start, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("megabytes", nargs="*", type=float, default=[1, 10, 100])
+    args = parser.parse_args()
+
+    if not LIBYAML:
+        print("PyYAML was built without libyaml; both columns use pure Python")
+
+    pure, fast = YamlSerializer(libyaml=False), YamlSerializer()
+    print(
+        f"{'MB':>8} {'load py':>9} {'load C':>9} {'save py':>9} {'save C':>9}"
+        f" {'speedup':>8}  (MB/s)"
+    )
+    for megabytes in args.megabytes:
+        data = make_document(megabytes)
+        save_py, text = timed(pure.dump, data)
+        save_c, fast_text = timed(fast.dump, data)
+        if fast_text != text:
+            raise SystemExit("libyaml output differs from PyYAML's")
+        load_py, _ = timed(pure.load, text)
+        load_c, _ = timed(fast.load, text)
+
+        size = len(text) / 2**20
+        speedup = (load_py + save_py) / (load_c + save_c)
+        print(
+            f"{size:>8.1f} {size / load_py:>9.2f} {size / load_c:>9.2f}"
+            f" {size / save_py:>9.2f} {size / save_c:>9.2f} {speedup:>7.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
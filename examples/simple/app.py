@@ -19,18 +19,23 @@ class ExampleCustomDataSourceApp(toga.App):
     def startup(self):
         self.main_window = toga.MainWindow(title=self.formal_name)
 
-        # Load data from YAML file
-        self.data_source = togax_settings.SchemaDataSource.from_yaml(
+        # Load data from YAML file in the background; the settings tree shows a
+        # placeholder until it's ready, so the window appears straight away
+        data_source = togax_settings.SchemaDataSource.load(
             "Simple Settings",
             "simple/small.yaml",
             # Comment the line above and use the line below in real apps
             # self.paths.config / "small.yaml",
             YOUR_SCHEMA.schema,
             example_yaml=self.paths.app / "example.yaml",
+            # Coalesce edits made while typing into one write every half second
+            save_delay=0.5,
+            # Validate and write changes on a worker thread
+            background_save=True,
         )
 
         # Create widgets based on the data source
-        box = togax_settings.SettingsTree(self.data_source)
+        self.settings = box = togax_settings.SettingsTree(data_source)
 
         if TOGA_PLATFORM == "toga_textual.factory":
             self.main_window.content = box
@@ -41,6 +46,12 @@ class ExampleCustomDataSourceApp(toga.App):
 
         self.main_window.show()
 
+    def on_exit(self):
+        # Make sure edits still waiting for the write-behind timer hit the disk
+        if self.settings.root_node is not None:
+            self.settings.root_node.flush()
+        return True
+
 
 def main():
     return ExampleCustomDataSourceApp(
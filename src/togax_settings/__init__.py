@@ -1,9 +1,28 @@
+from .backends import FileBackend, SqliteBackend, backend_for, convert
+from .history import UndoHistory
+from .instrumentation import CallbackSink, Instruments, LoggingSink, Stats
 from .schema_source import SchemaDataSource, SchemaNode
 from .settings import SettingsTree
+from .shared import Publisher, SharedSettings
+from .virtual import VirtualSettingsTree
+from .watcher import FileWatcher
 
 __all__ = [
+    "FileBackend",
+    "SqliteBackend",
+    "backend_for",
+    "convert",
     "SchemaNode",
     "SchemaDataSource",
     "SettingsTree",
+    "VirtualSettingsTree",
+    "FileWatcher",
+    "Instruments",
+    "LoggingSink",
+    "Stats",
+    "CallbackSink",
+    "Publisher",
+    "SharedSettings",
+    "UndoHistory",
     "togax_settings",
 ]
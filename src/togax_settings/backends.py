@@ -0,0 +1,252 @@
+import json
+import os
+import re
+import shutil
+import sqlite3
+import threading
+
+from .instrumentation import Instruments
+from .saver import AtomicWriter, file_digest
+from .serializers import JsonSerializer, MsgpackSerializer, YamlSerializer
+
+
+class FileBackend:
+    """Stores settings as a single file written by a serializer.
+
+    Every save rewrites the whole file, atomically, and is skipped when the
+    serialised bytes haven't changed (see AtomicWriter).
+    """
+
+    #: Whether update() can write individual leaves
+    incremental = False
+
+    def __init__(self, path, serializer=None, fsync_interval=0, instruments=None):
+        self.path = path
+        self.serializer = serializer or YamlSerializer()
+        self.writer = AtomicWriter(path, fsync_interval)
+        self.instruments = instruments if instruments is not None else Instruments()
+
+    def exists(self):
+        return os.path.exists(self.path)
+
+    def load(self):
+        with open(self.path, "rb") as file:
+            return self.serializer.load(file)
+
+    def save(self, data):
+        instruments = self.instruments
+        with instruments.span("serialize") as span:
+            encoded = self.serializer.dump(data)
+            span.set(bytes=len(encoded))
+        with instruments.span("write", bytes=len(encoded)) as span:
+            written = self.writer.write(encoded)
+            span.set(written=written)
+        if written:
+            instruments.count("bytes_written", len(encoded))
+
+    def update(self, changes):
+        return False
+
+    def digest(self):
+        """Return the digest of the file's contents (see content_digest)."""
+        if self.writer.digest is None and self.exists():
+            self.writer.digest = file_digest(self.path)
+        return self.writer.digest
+
+    def backup(self):
+        """Copy the stored settings aside, returning where to."""
+        backup_file = f"{self.path}.backup"
+        shutil.copy2(self.path, backup_file)
+        return backup_file
+
+    def sync(self):
+        self.writer.sync()
+
+    def close(self):
+        pass
+
+
+def _encode_path(path):
+    return json.dumps(list(path))
+
+
+def _rows(value, path=(), position=0):
+    # One row per node: (path, depth, position, kind, value), parents first
+    if isinstance(value, dict):
+        yield _encode_path(path), len(path), position, "dict", None
+        for index, (key, child) in enumerate(value.items()):
+            yield from _rows(child, path + (key,), index)
+    elif isinstance(value, list):
+        yield _encode_path(path), len(path), position, "list", None
+        for index, child in enumerate(value):
+            yield from _rows(child, path + (index,), index)
+    else:
+        yield _encode_path(path), len(path), position, "value", json.dumps(value)
+
+
+_IDENTIFIER = re.compile(r"[A-Za-z_][A-Za-z0-9_]*")
+
+
+class SqliteBackend:
+    """Stores settings in SQLite, one row per node keyed by its key path.
+
+    Changing a leaf value is a single ``UPDATE`` of its row, so saving an edit
+    costs the same however big the settings are. Adding, removing or renaming
+    nodes still rewrites every row, in one transaction. Keys and leaf values
+    must be representable in JSON.
+    """
+
+    incremental = True
+
+    def __init__(self, path, table="settings"):
+        # The table name goes into the SQL itself, so only plain identifiers
+        if not _IDENTIFIER.fullmatch(table):
+            raise ValueError(f"Invalid table name: {table!r}")
+        self.path = path
+        self.table = table
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        with self._connection:
+            self._connection.execute(
+                f"CREATE TABLE IF NOT EXISTS {table} ("
+                "path TEXT PRIMARY KEY, depth INTEGER NOT NULL, "
+                "position INTEGER NOT NULL, kind TEXT NOT NULL, value TEXT)"
+            )
+
+    def exists(self):
+        with self._lock:
+            row = self._connection.execute(
+                f"SELECT 1 FROM {self.table} WHERE path = ?", (_encode_path(()),)
+            ).fetchone()
+        return row is not None
+
+    def load(self):
+        with self._lock:
+            rows = self._connection.execute(
+                f"SELECT path, kind, value FROM {self.table} ORDER BY depth, position"
+            ).fetchall()
+        if not rows:
+            raise FileNotFoundError(f"No settings stored in {self.path}")
+
+        containers = {}
+        root = None
+        for encoded, kind, value in rows:
+            if kind == "dict":
+                value = {}
+                containers[encoded] = value
+            elif kind == "list":
+                value = []
+                containers[encoded] = value
+            else:
+                value = json.loads(value)
+            path = json.loads(encoded)
+            if not path:
+                root = value
+                continue
+            parent = containers[_encode_path(path[:-1])]
+            if isinstance(parent, list):
+                parent.append(value)
+            else:
+                parent[path[-1]] = value
+        return root
+
+    def save(self, data):
+        with self._lock, self._connection:
+            self._connection.execute(f"DELETE FROM {self.table}")
+            self._connection.executemany(
+                f"INSERT INTO {self.table} VALUES (?, ?, ?, ?, ?)", _rows(data)
+            )
+
+    def update(self, changes):
+        """Write new leaf values, given as (key path, value) pairs.
+
+        Returns False, having written nothing, if any of them isn't a leaf
+        already stored; the caller should save() everything instead.
+        """
+        with self._lock, self._connection:
+            for path, value in changes:
+                cursor = self._connection.execute(
+                    f"UPDATE {self.table} SET value = ? WHERE path = ? AND kind = 'value'",
+                    (json.dumps(value), _encode_path(path)),
+                )
+                if cursor.rowcount != 1:
+                    self._connection.rollback()
+                    return False
+        return True
+
+    def backup(self):
+        backup_file = f"{self.path}.backup"
+        with self._lock:
+            destination = sqlite3.connect(backup_file)
+            try:
+                self._connection.backup(destination)
+            finally:
+                destination.close()
+        return backup_file
+
+    def sync(self):
+        pass  # Every transaction is already durable
+
+    def close(self):
+        self._connection.close()
+
+
+_EXTENSIONS = {
+    ".yaml": lambda path: FileBackend(path, YamlSerializer()),
+    ".yml": lambda path: FileBackend(path, YamlSerializer()),
+    ".json": lambda path: FileBackend(path, JsonSerializer()),
+    ".msgpack": lambda path: FileBackend(path, MsgpackSerializer()),
+    ".mpk": lambda path: FileBackend(path, MsgpackSerializer()),
+    ".sqlite": SqliteBackend,
+    ".sqlite3": SqliteBackend,
+    ".db": SqliteBackend,
+}
+
+
+def backend_for(path):
+    """Return a backend for ``path``, chosen by its extension."""
+    extension = os.path.splitext(path)[1].lower()
+    try:
+        return _EXTENSIONS[extension](path)
+    except KeyError:
+        raise ValueError(
+            f"Unknown settings format {extension!r}; "
+            f"expected one of {', '.join(sorted(_EXTENSIONS))}"
+        )
+
+
+def convert(source, destination):
+    """Copy settings between formats, e.g. ``convert("a.yaml", "a.sqlite")``.
+
+    Either argument can be a path, whose format is picked by extension, or a
+    backend.
+    """
+    opened = []
+    if isinstance(source, str):
+        source = backend_for(source)
+        opened.append(source)
+    if isinstance(destination, str):
+        destination = backend_for(destination)
+        opened.append(destination)
+    try:
+        destination.save(source.load())
+        destination.sync()
+    finally:
+        for backend in opened:
+            backend.close()
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Convert a settings file to another format."
+    )
+    parser.add_argument("source")
+    parser.add_argument("destination")
+    args = parser.parse_args()
+    convert(args.source, args.destination)
+
+
+if __name__ == "__main__":
+    main()
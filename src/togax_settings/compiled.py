@@ -0,0 +1,229 @@
+from collections import OrderedDict
+
+from schema import (
+    And,
+    Literal,
+    Optional,
+    Schema,
+    SchemaError,
+    SchemaUnexpectedTypeError,
+)
+
+
+class IdentityCache:
+    """A bounded LRU cache keyed on object identity.
+
+    Schemas are usually unhashable dicts and lists that are never mutated once
+    built, so identity is both the cheapest and the only reliable key. Each
+    entry keeps a reference to its key object so the id can't be reused while
+    the entry is alive.
+    """
+
+    def __init__(self, factory, maxsize=4096):
+        self.factory = factory
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+
+    def __call__(self, obj):
+        key = id(obj)
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] is obj:
+            try:
+                self._entries.move_to_end(key)
+            except KeyError:
+                pass  # Evicted concurrently; the entry is still valid
+            return entry[1]
+
+        value = self.factory(obj)
+        self._entries[key] = (obj, value)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+        return value
+
+    def __len__(self):
+        return len(self._entries)
+
+    def clear(self):
+        self._entries.clear()
+
+
+def _compile_schema(schema):
+    if isinstance(schema, Schema):
+        return schema.validate
+
+    if issubclass(type(schema), type):
+        # Bare types are by far the most common leaf schema, so check them
+        # directly instead of going through Schema.validate.
+        def validate_type(data):
+            if isinstance(data, schema) and not (
+                isinstance(data, bool) and schema == int
+            ):
+                return data
+            raise SchemaUnexpectedTypeError(
+                f"{data!r} should be instance of {schema.__name__!r}", None
+            )
+
+        return validate_type
+
+    return Schema(schema).validate
+
+
+#: Return a callable validating data against ``schema``, raising SchemaError
+compile_schema = IdentityCache(_compile_schema)
+
+
+def _compile_validator(schema):
+    validate = compile_schema(schema)
+
+    def schema_validator(value):
+        if schema == float:
+            try:
+                value = float(value)
+            except ValueError as e:
+                return f"Not valid input: {e}"
+        if not schema:
+            return None
+        try:
+            validate(value)
+            return None
+        except SchemaError as e:
+            return f"Not valid input: {e}"
+
+    return schema_validator
+
+
+#: Return a widget-style validator for ``schema``: it returns an error message
+#: for invalid values and None otherwise.
+compile_validator = IdentityCache(_compile_validator)
+
+
+def _type_matches(key_type, schema_type):
+    # Mirrors the TYPE check in schema.Schema.validate for keys of key_type
+    return issubclass(key_type, schema_type) and not (
+        key_type is bool and schema_type is int
+    )
+
+
+def _test(schema):
+    """Return a boolean test for Schema(schema).validate succeeding.
+
+    Comparable values and plain callables are tested directly, which avoids
+    both building a Schema and formatting a SchemaError for every mismatch.
+    """
+    if isinstance(schema, (type, dict, list, tuple, set, frozenset, Literal)):
+        validate = compile_schema(schema)
+    elif hasattr(schema, "validate"):
+        validate = schema.validate
+    elif callable(schema):
+
+        def test(data):
+            try:
+                return bool(schema(data))
+            except Exception:
+                return False
+
+        return test
+    else:
+        return lambda data: schema == data
+
+    def test(data):
+        try:
+            validate(data)
+            return True
+        except SchemaError:
+            return False
+
+    return test
+
+
+def _all(tests):
+    def test(data):
+        return all(test(data) for test in tests)
+
+    return test
+
+
+class KeyDispatch:
+    """Index over a schema dict resolving data keys to the schema key they match.
+
+    Literal keys are found through the schema dict itself. Class keys and
+    ``Schema``/``And`` keys are tried in schema order, as
+    DictNode._get_child_schemas always has, but the list of candidates is
+    worked out once per data key type: class keys are resolved by type alone,
+    and predicates that start with a type check are dropped up front for keys
+    of any other type. Only predicates that can't be decided by type are
+    actually run.
+    """
+
+    def __init__(self, schema):
+        self.schema = schema
+        # (schema key, value schema, type guard, test or None if the guard
+        # alone decides the match)
+        self._patterns = []
+        for skey, value in schema.items():
+            guard, test = None, None
+            if isinstance(skey, type):
+                guard = skey
+            elif type(skey) in (Schema, Optional):
+                if isinstance(skey.schema, type):
+                    guard = skey.schema
+                else:
+                    test = _test(skey.schema)
+            elif type(skey) is And and all(
+                not hasattr(arg, "validate") for arg in skey.args
+            ):
+                # And only passes data through unchanged when no argument is
+                # a validator (such as Use), so its arguments can be tested
+                # independently.
+                args = list(skey.args)
+                if args and isinstance(args[0], type):
+                    guard = args.pop(0)
+                test = _all([_test(arg) for arg in args])
+            elif isinstance(skey, (Schema, And)):
+                test = _test(skey)
+            else:
+                continue
+            self._patterns.append((skey, value, guard, test))
+        self._candidates = {}
+
+    def _candidates_for(self, key_type):
+        candidates = []
+        for skey, value, guard, test in self._patterns:
+            if guard is not None and not _type_matches(key_type, guard):
+                continue
+            candidates.append((skey, value, test))
+            if test is None:
+                break  # Certain to match, so nothing after it can
+        candidates = tuple(candidates)
+        self._candidates[key_type] = candidates
+        return candidates
+
+    def resolve(self, key):
+        """Return (schema key, key schema, value schema) for a data key."""
+        schema = self.schema
+        if key in schema:
+            return key, None, schema[key]
+
+        schema_key = child_keyschema = child_schema = None
+        candidates = self._candidates.get(type(key))
+        if candidates is None:
+            candidates = self._candidates_for(type(key))
+        for skey, value, test in candidates:
+            if test is not None and not test(key):
+                continue
+            schema_key = child_keyschema = skey
+            child_schema = value
+            break
+
+        if child_schema is None:
+            for fallback in (str, int):
+                if fallback in schema:
+                    schema_key = fallback
+                    child_schema = schema[fallback]
+                    break
+
+        return schema_key, child_keyschema, child_schema
+
+
+#: Return the (cached) KeyDispatch for a schema dict
+key_dispatch = IdentityCache(KeyDispatch)
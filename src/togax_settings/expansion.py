@@ -0,0 +1,88 @@
+import json
+import os
+from collections import OrderedDict
+
+
+class ExpansionState:
+    """Which branches of a settings tree are expanded.
+
+    Branches are identified by their key path from the root, so the state
+    survives the node tree being rebuilt (on reset, or when reloading). Paths
+    the user hasn't toggled are expanded if they are less than
+    ``expand_depth`` levels deep; None expands everything. If ``state_file``
+    is given, toggled paths are also saved there as JSON and restored the
+    next time the state is created.
+
+    With ``max_expanded``, at most that many branches keep their widgets at
+    once; expanding another one collapses the branch expanded longest ago.
+    """
+
+    def __init__(self, expand_depth=None, state_file=None, max_expanded=None):
+        self.expand_depth = expand_depth
+        self.state_file = state_file
+        self.max_expanded = max_expanded
+        self.expanded = set()
+        self.collapsed = set()
+        # Branches whose widgets currently exist, oldest first
+        self._open = OrderedDict()
+        if state_file is not None:
+            self._load()
+
+    def is_expanded(self, path):
+        if path in self.expanded:
+            return True
+        if path in self.collapsed:
+            return False
+        return self.expand_depth is None or len(path) < self.expand_depth
+
+    def set_expanded(self, path, expanded):
+        if expanded:
+            self.expanded.add(path)
+            self.collapsed.discard(path)
+        else:
+            self.collapsed.add(path)
+            self.expanded.discard(path)
+        if self.state_file is not None:
+            self._save()
+
+    def opened(self, path, branch):
+        """Record that ``branch`` has built widgets for its children.
+
+        If that takes the number of open branches over max_expanded, the least
+        recently opened ones that aren't ancestors of ``path`` are collapsed.
+        """
+        self._open.pop(path, None)
+        self._open[path] = branch
+        while self.max_expanded is not None and len(self._open) > self.max_expanded:
+            for open_path, open_branch in self._open.items():
+                if open_path != path[: len(open_path)]:
+                    # Collapsing calls closed() for it and all its descendants
+                    open_branch.collapse()
+                    break
+            else:
+                break
+
+    def closed(self, path):
+        self._open.pop(path, None)
+
+    def _load(self):
+        if not os.path.exists(self.state_file):
+            return
+        try:
+            with open(self.state_file) as file:
+                state = json.load(file)
+            self.expanded = {tuple(path) for path in state.get("expanded", [])}
+            self.collapsed = {tuple(path) for path in state.get("collapsed", [])}
+        except (OSError, ValueError) as e:
+            print(f"Could not load expansion state: {e}")
+
+    def _save(self):
+        state = {
+            "expanded": sorted(map(list, self.expanded), key=repr),
+            "collapsed": sorted(map(list, self.collapsed), key=repr),
+        }
+        try:
+            with open(self.state_file, "w") as file:
+                json.dump(state, file, default=str)
+        except OSError as e:
+            print(f"Could not save expansion state: {e}")
@@ -0,0 +1,139 @@
+import sys
+from collections import deque
+
+
+def _size(value):
+    # Roughly how much memory a value held by the history takes
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        for key, item in value.items():
+            size += _size(key) + _size(item)
+    elif isinstance(value, (list, tuple)):
+        for item in value:
+            size += _size(item)
+    return size
+
+
+class UndoHistory:
+    """The edits made to a SchemaDataSource, so they can be undone and redone.
+
+    An edit isn't stored as a copy of the settings, but as a pair of
+    operations that undo and redo it, holding copies of only the values it
+    changed: the old and new value of a leaf that was edited, or a subtree
+    that was added or removed. The edits made in a batch() are undone
+    together. Once the history holds more than ``max_bytes`` (roughly
+    measured), the oldest edits are forgotten; an edit bigger than that on
+    its own, like replacing all of the settings, forgets everything.
+
+    The source records edits and applies the operations itself (see
+    SchemaDataSource.undo); an operation is one of ``("set", path, value)``,
+    ``("insert", parent_path, index, key, value)``, ``("remove", path)`` or
+    ``("rename", path, new_key)``.
+    """
+
+    def __init__(self, max_bytes=16 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._undo = deque()  # (operations, size), oldest first
+        self._redo = []  # (operations, size), next to redo last
+        self._size = 0
+        self._group = None
+        self._depth = 0
+        self._applying = False
+
+    @property
+    def can_undo(self):
+        return bool(self._undo)
+
+    @property
+    def can_redo(self):
+        return bool(self._redo)
+
+    @property
+    def size(self):
+        """Roughly how many bytes the history holds."""
+        return self._size
+
+    def record(self, undo, redo):
+        """Record an edit, as the operations that undo and redo it."""
+        if self._applying:
+            return
+        operation = (undo, redo, _size(undo) + _size(redo))
+        if self._group is not None:
+            self._group.append(operation)
+        else:
+            self._push([operation])
+
+    def begin(self):
+        """Start recording edits to undo together, until the matching end()."""
+        self._depth += 1
+        if self._depth == 1:
+            self._group = []
+
+    def end(self):
+        self._depth -= 1
+        if self._depth == 0:
+            group, self._group = self._group, None
+            if group and not self._applying:
+                self._push(group)
+
+    def checkpoint(self):
+        """Return a marker for the edits recorded so far, to rollback() to."""
+        return None if self._group is None else len(self._group)
+
+    def rollback(self, checkpoint):
+        """Forget the edits recorded since checkpoint() (in the same group)."""
+        if self._group is not None and checkpoint is not None:
+            del self._group[checkpoint:]
+
+    def clear(self):
+        self._undo.clear()
+        self._redo.clear()
+        self._size = 0
+        if self._group is not None:
+            self._group.clear()
+
+    def undo(self, apply):
+        """Undo the last edit, by passing its undo operations to ``apply``.
+
+        Returns False if there's nothing to undo. If apply raises, the
+        history is cleared, as it no longer matches the settings.
+        """
+        if not self._undo:
+            return False
+        entry = self._undo.pop()
+        self._run(apply, [undo for undo, _, _ in reversed(entry[0])])
+        self._redo.append(entry)
+        return True
+
+    def redo(self, apply):
+        """Redo the last edit undone, like undo()."""
+        if not self._redo:
+            return False
+        entry = self._redo.pop()
+        self._run(apply, [redo for _, redo, _ in entry[0]])
+        self._undo.append(entry)
+        return True
+
+    def _run(self, apply, operations):
+        self._applying = True
+        try:
+            for operation in operations:
+                apply(operation)
+        except BaseException:
+            self.clear()
+            raise
+        finally:
+            self._applying = False
+
+    def _push(self, operations):
+        size = sum(operation[2] for operation in operations)
+        # A new edit can't be redone past
+        while self._redo:
+            self._size -= self._redo.pop()[1]
+        if size > self.max_bytes:
+            self.clear()
+            return
+        self._undo.append((operations, size))
+        self._size += size
+        while self._size > self.max_bytes:
+            self._size -= self._undo.popleft()[1]
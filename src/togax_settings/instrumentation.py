@@ -0,0 +1,240 @@
+import logging
+import threading
+import time
+
+logger = logging.getLogger("togax_settings")
+
+
+class Span:
+    """Times one phase; see Instruments.span."""
+
+    __slots__ = ("instruments", "phase", "info", "start")
+
+    def __init__(self, instruments, phase, info):
+        self.instruments = instruments
+        self.phase = phase
+        self.info = info
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        seconds = time.perf_counter() - self.start
+        if exc_type is not None:
+            self.info["error"] = exc_type.__name__
+        self.instruments.record(self.phase, seconds, self.info)
+
+    def set(self, **info):
+        """Add to what's reported about the phase, like node counts or sizes."""
+        self.info.update(info)
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        pass
+
+    def set(self, **info):
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class Instruments:
+    """Times the phases of loading, validating, saving and showing settings.
+
+    Each phase is reported to every sink as ``sink.span(phase, seconds,
+    info)``, where info is a dict of what's known about it, like the number
+    of nodes or bytes involved, and running totals as ``sink.count(name,
+    amount)``. The phases are:
+
+    * parse: reading and parsing the settings (validating them too, if
+      ``validated`` is set in info)
+    * validate: checking the settings against the schema
+    * build: creating the node tree
+    * to_dict: copying the settings out of the node tree to save them
+    * save: validating, serialising and storing them
+    * serialize, write: turning them into bytes and writing those to a file
+    * publish: sharing them with other processes (see Publisher)
+    * reconcile: bringing the tree up to date with changed settings
+    * render: creating the widgets of a SettingsTree, or of a branch as it's
+      expanded
+
+    and the counters saves, validations, bytes_written and widgets_created.
+
+    With no sinks this does nothing but hand out a shared do-nothing span,
+    so it costs next to nothing to leave in place. Sinks can be added at any
+    time. Saves can run on a worker thread (see save_async), so sinks may
+    be called from one.
+    """
+
+    def __init__(self, *sinks):
+        self.sinks = list(sinks)
+
+    @property
+    def enabled(self):
+        """Are there any sinks? Worth checking before measuring anything slow."""
+        return bool(self.sinks)
+
+    def add_sink(self, sink):
+        self.sinks.append(sink)
+
+    def remove_sink(self, sink):
+        self.sinks.remove(sink)
+
+    def span(self, phase, **info):
+        """Return a context manager that times the phase inside it."""
+        if not self.sinks:
+            return _NULL_SPAN
+        return Span(self, phase, info)
+
+    def record(self, phase, seconds, info):
+        """Report a phase that was timed some other way."""
+        for sink in self.sinks:
+            sink.span(phase, seconds, info)
+
+    def count(self, name, amount=1):
+        for sink in self.sinks:
+            sink.count(name, amount)
+
+    def replay(self, events):
+        """Report what a Recorder was sent."""
+        for kind, *event in events:
+            if kind == "span":
+                self.record(*event)
+            else:
+                self.count(*event)
+
+
+class LoggingSink:
+    """Logs each phase, with its duration and info. Counters aren't logged."""
+
+    def __init__(self, logger=logger, level=logging.DEBUG):
+        self.logger = logger
+        self.level = level
+
+    def span(self, phase, seconds, info):
+        if self.logger.isEnabledFor(self.level):
+            details = "".join(f" {key}={value}" for key, value in info.items())
+            self.logger.log(
+                self.level, "%s took %.2f ms%s", phase, seconds * 1000, details
+            )
+
+    def count(self, name, amount):
+        pass
+
+
+class PhaseStats:
+    __slots__ = ("count", "total", "maximum")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.maximum = 0.0
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+    def __repr__(self):
+        return (
+            f"<PhaseStats count={self.count} total={self.total:.6f} "
+            f"maximum={self.maximum:.6f}>"
+        )
+
+
+class Stats:
+    """Keeps running totals in memory.
+
+    ``phases`` maps each phase to a PhaseStats of how often it ran and for
+    how long, and ``counters`` holds the counters.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.phases = {}
+        self.counters = {}
+
+    def span(self, phase, seconds, info):
+        with self._lock:
+            stats = self.phases.get(phase)
+            if stats is None:
+                stats = self.phases[phase] = PhaseStats()
+            stats.count += 1
+            stats.total += seconds
+            stats.maximum = max(stats.maximum, seconds)
+
+    def count(self, name, amount):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def summary(self):
+        """Return the totals as plain data, for logging or JSON."""
+        with self._lock:
+            return {
+                "phases": {
+                    phase: {
+                        "count": stats.count,
+                        "total": stats.total,
+                        "mean": stats.mean,
+                        "maximum": stats.maximum,
+                    }
+                    for phase, stats in self.phases.items()
+                },
+                "counters": dict(self.counters),
+            }
+
+    def reset(self):
+        with self._lock:
+            self.phases = {}
+            self.counters = {}
+
+
+class CallbackSink:
+    """Calls ``on_span(phase, seconds, info)`` for each phase, and
+    ``on_count(name, amount)`` if given for each counter."""
+
+    def __init__(self, on_span, on_count=None):
+        self.on_span = on_span
+        self.on_count = on_count
+
+    def span(self, phase, seconds, info):
+        self.on_span(phase, seconds, info)
+
+    def count(self, name, amount):
+        if self.on_count is not None:
+            self.on_count(name, amount)
+
+
+class Recorder:
+    """Keeps what it's sent as ``events``, a list that can be pickled, so work
+    done in another process can be timed and reported with replay() here."""
+
+    def __init__(self):
+        self.events = []
+
+    def span(self, phase, seconds, info):
+        self.events.append(("span", phase, seconds, info))
+
+    def count(self, name, amount):
+        self.events.append(("count", name, amount))
+
+
+def count_values(data):
+    """Return the number of nodes a tree built from ``data`` would have."""
+    count = 0
+    stack = [data]
+    while stack:
+        value = stack.pop()
+        count += 1
+        if isinstance(value, dict):
+            stack.extend(value.values())
+        elif isinstance(value, list):
+            stack.extend(value)
+    return count
@@ -0,0 +1,146 @@
+import json
+import os
+
+from .saver import file_digest
+
+
+def _walk(data, path):
+    for key in path:
+        data = data[key]
+    return data
+
+
+def apply_operation(data, operation):
+    """Apply one journal operation to ``data``, returning the new document."""
+    op = operation["op"]
+    path = operation["path"]
+    if not path:
+        if op in ("add", "replace"):
+            return operation["value"]
+        raise ValueError(f"Can't {op} the root of a document")
+
+    parent = _walk(data, path[:-1])
+    key = path[-1]
+    if op == "replace":
+        parent[key] = operation["value"]
+    elif op == "add":
+        if isinstance(parent, list):
+            parent.insert(key, operation["value"])
+        else:
+            parent[key] = operation["value"]
+    elif op == "remove":
+        del parent[key]
+    elif op == "move":
+        # Only renames within a dict are journaled; keep the key's position
+        old_key = operation["from"][-1]
+        items = [(key if k == old_key else k, v) for k, v in parent.items()]
+        parent.clear()
+        parent.update(items)
+    else:
+        raise ValueError(f"Unknown journal operation {op!r}")
+    return data
+
+
+def _exact(value):
+    # Does JSON give back value just as it is? Dict keys that aren't strings
+    # come back as strings, and tuples as lists.
+    stack = [value]
+    while stack:
+        value = stack.pop()
+        if isinstance(value, dict):
+            if not all(type(key) is str for key in value):
+                return False
+            stack.extend(value.values())
+        elif type(value) is list:
+            stack.extend(value)
+        elif value is not None and type(value) not in (str, int, float, bool):
+            return False
+    return True
+
+
+class Journal:
+    """An append-only log of edits made since a settings file was last written.
+
+    The log lives next to the settings file, with one JSON object per line.
+    The first records a digest of the settings file the edits apply to, so a
+    log left behind by a compaction that was interrupted after rewriting the
+    file is recognised as stale instead of being applied twice. Each further
+    line is an operation in the style of JSON Patch, ``{"op": "replace",
+    "path": [...], "value": ...}`` with ``add``, ``remove`` and ``move`` (for
+    renamed keys) as well, except that paths are lists of keys and list
+    indices rather than JSON pointers, so non-string keys survive.
+    """
+
+    def __init__(self, settings_file, fsync=False):
+        self.settings_file = settings_file
+        self.path = f"{settings_file}.journal"
+        self.fsync = fsync
+        self.entries = 0
+
+    def exists(self):
+        return os.path.exists(self.path)
+
+    def append(self, operations, base):
+        """Append operations made against the file whose digest is ``base``.
+
+        Raises ValueError, and appends nothing, if JSON can't represent them
+        exactly (like a dict with int keys), so the file has to be rewritten.
+        """
+        for operation in operations:
+            if not _exact(operation):
+                raise ValueError(f"Can't journal {operation!r} exactly")
+        lines = [json.dumps(operation) + "\n" for operation in operations]
+        with open(self.path, "a", encoding="utf-8") as file:
+            if file.tell() == 0:
+                file.write(json.dumps({"base": base}) + "\n")
+            file.writelines(lines)
+            file.flush()
+            if self.fsync:
+                os.fsync(file.fileno())
+        self.entries += len(lines)
+
+    def operations(self):
+        """Return the digest the log applies to, and the operations in it."""
+        base, operations = None, []
+        with open(self.path, encoding="utf-8") as file:
+            for number, line in enumerate(file):
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    break  # A write cut short by a crash; nothing follows it
+                if number == 0:
+                    base = entry.get("base")
+                else:
+                    operations.append(entry)
+        return base, operations
+
+    def replay(self, data):
+        """Apply the logged operations to ``data``, as loaded from the file.
+
+        Returns the updated data and the number of operations applied.
+        """
+        if not self.exists():
+            return data, 0
+        base, operations = self.operations()
+        if base != file_digest(self.settings_file).hex():
+            print(f"Discarding {self.path}, which doesn't match {self.settings_file}")
+            self.clear()
+            return data, 0
+        for operation in operations:
+            data = apply_operation(data, operation)
+        self.entries = len(operations)
+        return data, len(operations)
+
+    def set_aside(self):
+        """Move the log out of the way, to ``<path>.backup``, and return that."""
+        backup = f"{self.path}.backup"
+        os.replace(self.path, backup)
+        self.entries = 0
+        return backup
+
+    def clear(self):
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+        self.entries = 0
@@ -1,26 +1,170 @@
-from schema import And, Schema, SchemaError
-from toga.sources import Source
+import bisect
+from contextlib import contextmanager
 
+from .compiled import compile_validator, key_dispatch
 
-def _get_validator(schema):
-    def schema_validator(value):
-        if schema == float:
-            try:
-                value = float(value)
-            except ValueError as e:
-                return f"Not valid input: {e}"
-        if not schema:
-            return None
-        try:
-            Schema(schema).validate(value)
-            return None
-        except SchemaError as e:
-            return f"Not valid input: {e}"
 
-    return schema_validator
+def _copy_tree(value):
+    if isinstance(value, dict):
+        return {key: _copy_tree(item) for key, item in value.items()}
+    elif isinstance(value, list):
+        return [_copy_tree(item) for item in value]
+    return value
+
+
+class SchemaInfo:
+    """Schema metadata shared by every node matched with the same sub-schema.
+
+    Siblings matched by the same schema key (all the entries under a ``str``
+    key, or all the items of a list) share one instance, interned on their
+    parent's SchemaInfo, so a node only has to store its own key and value.
+    """
+
+    __slots__ = (
+        "schema",
+        "keyschema",
+        "validator",
+        "key_validator",
+        "path",
+        "lazy",
+        "_children",
+    )
+
+    def __init__(self, schema=None, keyschema=None, path=(), lazy=False):
+        self.schema = schema
+        self.keyschema = keyschema
+        self.validator = compile_validator(schema)
+        self.key_validator = compile_validator(keyschema)
+        self.path = path
+        # Lazy trees only build a node's children when they're first needed
+        self.lazy = lazy
+        self._children = {}
+
+    def child(self, parent_key, schema_key, keyschema, schema):
+        """Return the shared info for a child matched with ``schema_key``."""
+        if isinstance(self.schema, dict):
+            # schema_key is the key of this schema dict the child was matched
+            # with, as found by DictNode._get_child_schemas
+            suffix = (parent_key if schema_key is None else schema_key,)
+        elif isinstance(self.schema, list):
+            suffix = (0,)
+        else:
+            suffix = ()
+        cache_key = (suffix, id(keyschema), id(schema))
+        info = self._children.get(cache_key)
+        if info is None:
+            info = SchemaInfo(schema, keyschema, self.path + suffix, self.lazy)
+            self._children[cache_key] = info
+        return info
+
+
+@contextmanager
+def held_notifications(root):
+    """Queue notifications from the nodes under ``root`` until the outermost
+    such block for it ends.
+
+    They are then sent in the order they were made, except that a node
+    changed several times is only announced once, and nodes added or removed
+    in the meantime aren't announced as changed at all. The queue is kept on
+    the root (a SchemaDataSource, say, which starts with ``_held = None``),
+    so other trees carry on notifying as usual.
+    """
+    outermost = root._held is None
+    if outermost:
+        root._held = []
+    try:
+        yield
+    finally:
+        if outermost:
+            held, root._held = root._held, None
+            _send_held(held)
+
+
+def _send_held(held):
+    # Nodes added or removed in the meantime aren't announced as changed, and
+    # nothing inside them is announced at all: an added node's widgets are
+    # built from its subtree as it is by then, and a removed node's widgets
+    # go with everything under them. The queue keeps every node alive, so
+    # ids are unique within it.
+    moved = set()
+    for node, notification, kwargs in held:
+        if notification == "add_node" and "child" in kwargs:
+            moved.add(id(kwargs["child"]))
+        elif notification == "remove_node":
+            moved.add(id(node))
+    changed = set()
+    for node, notification, kwargs in held:
+        if notification == "change_node":
+            if id(node) in changed or _inside(node, moved):
+                continue
+            changed.add(id(node))
+        elif notification == "remove_node":
+            if _inside(node.parent, moved):
+                continue
+        elif _inside(node, moved):
+            continue
+        node._send(notification, kwargs)
+
+
+def _inside(node, ids):
+    # Is node, or one of its ancestors, one of the nodes with these ids?
+    while node is not None and ids:
+        if id(node) in ids:
+            return True
+        node = node.parent
+    return False
+
+
+def _same_kind(value, new_value):
+    # Can a node holding value be updated to hold new_value, or does it need
+    # replacing with a node of another class?
+    if isinstance(value, dict):
+        return isinstance(new_value, dict)
+    if isinstance(value, list):
+        return isinstance(new_value, list)
+    return not isinstance(new_value, (dict, list))
 
 
-class BaseNode(Source):
+def _in_order(keys, new_keys):
+    # The largest set of keys whose order is the same in both sequences (a
+    # longest increasing subsequence of their new positions)
+    position = {key: index for index, key in enumerate(new_keys)}
+    keys = [key for key in keys if key in position]
+    tails = []  # Index into keys of the smallest tail of each run length
+    tail_positions = []
+    previous = [None] * len(keys)
+    for index, key in enumerate(keys):
+        run = bisect.bisect_left(tail_positions, position[key])
+        previous[index] = tails[run - 1] if run else None
+        if run == len(tails):
+            tails.append(index)
+            tail_positions.append(position[key])
+        else:
+            tails[run] = index
+            tail_positions[run] = position[key]
+    kept = set()
+    index = tails[-1] if tails else None
+    while index is not None:
+        kept.add(keys[index])
+        index = previous[index]
+    return kept
+
+
+# Shared placeholders for nodes without listeners or children of their own
+_NO_LISTENERS = ()
+_NO_CHILDREN = ()
+
+
+class BaseNode:
+    """A node of the settings tree, and a Toga data source for its widgets.
+
+    The listener protocol of toga.sources.Source is implemented here rather
+    than inherited, as Source has no ``__slots__`` and would give every node
+    a ``__dict__``.
+    """
+
+    __slots__ = ("key", "value", "parent", "info", "_children", "_listeners")
+
     def __init__(
         self,
         key,
@@ -29,31 +173,109 @@ class BaseNode(Source):
         keyschema=None,
         schema=None,
         path=(),
+        schema_key=None,
+        lazy=False,
     ):
-        super().__init__()
+        # The listener list is only allocated once a listener is added
+        self._listeners = _NO_LISTENERS
         self.key = key
         self.value = value
         self.parent = parent
-        self.children = []
-        self.keyschema = keyschema
-        self.key_validator = _get_validator(self.keyschema)
-        self.schema = schema
-        self.validator = _get_validator(self.schema)
-        self.path = self._construct_path()
-
-    def _construct_path(self):
-        if self.parent is None:
-            return ()
-        parent_path = self.parent.path
-        if isinstance(self.parent.schema, dict):
-            for schema_key, schema_value in self.parent.schema.items():
-                if schema_value == self.schema:
-                    return parent_path + (schema_key,)
-            else:
-                return parent_path + (self.parent.key,)
-        elif isinstance(self.parent.schema, list):
-            return parent_path + (0,)
-        return parent_path
+        self._children = _NO_CHILDREN
+        if parent is None:
+            self.info = SchemaInfo(schema, keyschema, (), lazy)
+        else:
+            self.info = parent.info.child(parent.key, schema_key, keyschema, schema)
+
+    @property
+    def schema(self):
+        return self.info.schema
+
+    @property
+    def keyschema(self):
+        return self.info.keyschema
+
+    @property
+    def validator(self):
+        return self.info.validator
+
+    @property
+    def key_validator(self):
+        return self.info.key_validator
+
+    @property
+    def path(self):
+        return self.info.path
+
+    @property
+    def lazy(self):
+        return self.info.lazy
+
+    @property
+    def key_path(self):
+        """The keys (and list indices) leading from the root to this node."""
+        path = []
+        node = self
+        while node.parent is not None:
+            path.append(node.key)
+            node = node.parent
+        return tuple(reversed(path))
+
+    @property
+    def listeners(self):
+        return self._listeners
+
+    def add_listener(self, listener):
+        if self._listeners is _NO_LISTENERS:
+            self._listeners = []
+        if listener not in self._listeners:
+            self._listeners.append(listener)
+
+    def remove_listener(self, listener):
+        # Like add_listener, ignores listeners that aren't registered, so a
+        # widget can stop listening more than once
+        if listener in self._listeners:
+            self._listeners.remove(listener)
+
+    def notify(self, notification, **kwargs):
+        root = self
+        while root.parent is not None:
+            root = root.parent
+        held = getattr(root, "_held", None)
+        if held is not None:
+            held.append((self, notification, kwargs))
+        else:
+            self._send(notification, kwargs)
+
+    def _send(self, notification, kwargs):
+        # Iterate over a copy, as listeners may remove themselves when told a
+        # node was removed. Handlers may be named with or without the
+        # "source_" prefix used since Toga 0.5.
+        for listener in tuple(self._listeners):
+            method = getattr(listener, f"source_{notification}", None)
+            if method is None:
+                method = getattr(listener, notification, None)
+            if method:
+                method(**kwargs)
+
+    def child(self, key):
+        """Return the child stored under ``key``, or raise KeyError."""
+        raise KeyError(key)
+
+    def _index_child(self, child):
+        pass
+
+    def _unindex_child(self, key):
+        pass
+
+    def rename(self, new_key):
+        """Move this node to ``new_key`` in its parent dict."""
+        old_key = self.key
+        self.key = new_key
+        if self.parent is not None:
+            self.parent.value[new_key] = self.parent.value.pop(old_key)
+            self.parent._unindex_child(old_key)
+            self.parent._index_child(self)
 
     def update_value(self, new_value):
         if self.validator:
@@ -66,6 +288,43 @@ class BaseNode(Source):
             self.parent.value[self.key] = new_value
         self.notify("change_node", item=self)
 
+    def reconcile(self, value):
+        """Make this subtree hold ``value``, changing as few nodes as possible.
+
+        Nodes whose values are unchanged are kept as they are. Listeners are
+        told about each node that changed ("change_node"), was removed
+        ("remove_node", sent to the removed node) or added ("add_node", with
+        the index it was added at). ``value`` must be the same kind of value
+        (dict, list or anything else) as the node holds now. Returns the
+        number of notifications sent.
+        """
+        if type(value) is type(self.value) and value == self.value:
+            return 0
+        self.value = value
+        if self.parent is not None:
+            self.parent.value[self.key] = value
+        self.notify("change_node", item=self)
+        return 1
+
+    def _reconcile_child(self, index, child, value):
+        if _same_kind(child.value, value):
+            return child.reconcile(value)
+        # A dict became a list, say, so the node has to be replaced
+        replacement = self._create_child(child.key, value)
+        self._children[index] = replacement
+        self._index_child(replacement)
+        self.value[child.key] = value
+        child.notify("remove_node", key=child.key)
+        self.notify("add_node", parent=self, index=index, child=replacement)
+        return 2
+
+    @property
+    def children(self):
+        if self._children is None:
+            self._children = []
+            self._add_children()
+        return self._children
+
     def __len__(self):
         return len(self.children)
 
@@ -73,6 +332,8 @@ class BaseNode(Source):
         return self.children[index]
 
     def can_have_children(self):
+        if self._children is None:
+            return bool(self.value)
         return bool(self.children)
 
     @property
@@ -84,74 +345,146 @@ class BaseNode(Source):
 
 
 class DictNode(BaseNode):
+    # Children by key, built the first time one is looked up
+    __slots__ = ("_index",)
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        self._add_children()
+        self._index = None
+        if self.lazy:
+            self._children = None
+        else:
+            self._children = []
+            self._add_children()
 
     def _add_children(self):
         for child_key, child_value in self.value.items():
-            child_keyschema, child_schema = self._get_child_schemas(child_key)
-            child = create_node(
-                child_key,
-                child_value,
-                parent=self,
-                keyschema=child_keyschema,
-                schema=child_schema,
-                path=self.path,
-            )
-            self.children.append(child)
+            self.children.append(self._create_child(child_key, child_value))
 
-    def _get_child_schemas(self, key):
-        child_keyschema = None
-        child_schema = None
+    def child(self, key):
+        if self._index is None:
+            self._index = {child.key: child for child in self.children}
+        return self._index[key]
 
-        if self.schema is None:
-            return None, None
+    def _index_child(self, child):
+        if self._index is not None:
+            self._index[child.key] = child
 
-        if isinstance(self.schema, dict):
-            if key in self.schema:
-                child_schema = self.schema[key]
+    def _unindex_child(self, key):
+        if self._index is not None:
+            del self._index[key]
+
+    def _create_child(self, key, value):
+        schema_key, keyschema, schema = self._get_child_schemas(key)
+        return create_node(
+            key,
+            value,
+            parent=self,
+            keyschema=keyschema,
+            schema=schema,
+            path=self.path,
+            schema_key=schema_key,
+        )
+
+    def reconcile(self, value):
+        if self._children is None:
+            return super().reconcile(value)  # No nodes below this one yet
+
+        # Keys that moved are removed and added again where they now belong
+        old = self.value
+        kept = _in_order(old, value)
+        by_key = {child.key: child for child in self._children}
+        self._children = [child for child in self._children if child.key in kept]
+
+        notified = 0
+        for key in [key for key in old if key not in kept]:
+            del old[key]
+            by_key[key].notify("remove_node", key=key)
+            notified += 1
+        for index, (key, item) in enumerate(value.items()):
+            if key in kept:
+                notified += self._reconcile_child(index, by_key[key], item)
             else:
-                for k, v in self.schema.items():
-                    if isinstance(k, type):
-                        try:
-                            Schema(k).validate(key)
-                            child_schema = v
-                            child_keyschema = k
-                            break
-                        except SchemaError:
-                            pass
-                    elif isinstance(k, (Schema, And)):
-                        try:
-                            k.validate(key)
-                            child_schema = v
-                            child_keyschema = k
-                            break
-                        except SchemaError:
-                            pass
-            if child_schema is None:
-                child_schema = self.schema.get(
-                    key, self.schema.get(str, self.schema.get(int, None))
-                )
-
-        return child_keyschema, child_schema
+                old[key] = item
+                child = self._create_child(key, item)
+                self._children.insert(index, child)
+                self.notify("add_node", parent=self, index=index, child=child)
+                notified += 1
+
+        if list(old) != list(value):
+            # New keys were added at the end; put them where they belong
+            items = [(key, old[key]) for key in value]
+            old.clear()
+            old.update(items)
+        self._index = None
+        return notified
+
+    def _get_child_schemas(self, key):
+        """Return the schema key matching ``key``, and the key and value
+        schemas for a child stored under it."""
+        if isinstance(self.schema, dict):
+            return key_dispatch(self.schema).resolve(key)
+        return None, None, None
 
     def to_dict(self):
+        if self._children is None:
+            return _copy_tree(self.value)
         return {child.key: child.to_dict() for child in self.children}
 
 
 class ListNode(BaseNode):
+    __slots__ = ()
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        self._add_children()
+        if self.lazy:
+            self._children = None
+        else:
+            self._children = []
+            self._add_children()
 
     def _add_children(self):
         for index, item in enumerate(self.value):
-            child_schema = self._get_list_item_schema()
-            child = create_node(
-                index, item, parent=self, schema=child_schema, path=self.path
+            self.children.append(self._create_child(index, item))
+
+    def _create_child(self, index, value):
+        return create_node(
+            index,
+            value,
+            parent=self,
+            schema=self._get_list_item_schema(),
+            path=self.path,
+        )
+
+    def reconcile(self, value):
+        if self._children is None:
+            return super().reconcile(value)
+
+        # Items are matched up by position, so inserting one near the start
+        # changes everything after it
+        old = self.value
+        notified = 0
+        for index in range(min(len(old), len(value))):
+            notified += self._reconcile_child(
+                index, self._children[index], value[index]
             )
-            self.children.append(child)
+        while len(old) > len(value):
+            old.pop()
+            child = self._children.pop()
+            child.notify("remove_node", key=child.key)
+            notified += 1
+        for index in range(len(old), len(value)):
+            old.append(value[index])
+            child = self._create_child(index, value[index])
+            self._children.append(child)
+            self.notify("add_node", parent=self, index=index, child=child)
+            notified += 1
+        return notified
+
+    def child(self, index):
+        if type(index) is not int or not 0 <= index < len(self.children):
+            raise KeyError(index)
+        return self.children[index]
 
     def _get_list_item_schema(self):
         if isinstance(self.schema, list):
@@ -160,18 +493,19 @@ class ListNode(BaseNode):
 
     def add_list_item(self, value):
         self.value.append(value)
-        child_schema = self._get_list_item_schema()
-        child = create_node(
-            len(self.children), value, parent=self, schema=child_schema, path=self.path
-        )
+        child = self._create_child(len(self.children), value)
         self.children.append(child)
         self.notify("add_node", parent=self, child=child, key=child.key)
 
     def to_dict(self):
+        if self._children is None:
+            return _copy_tree(self.value)
         return [child.to_dict() for child in self.children]
 
 
 class ValueNode(BaseNode):
+    __slots__ = ()
+
     def _add_children(self):
         pass  # Value nodes don't have children
 
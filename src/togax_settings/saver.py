@@ -0,0 +1,239 @@
+import asyncio
+import atexit
+import hashlib
+import os
+import tempfile
+import time
+import weakref
+
+# Savers to flush and writers to sync when the process exits. One handler
+# covers all of them, so creating many doesn't pile up exit handlers.
+_savers = weakref.WeakSet()
+_writers = weakref.WeakSet()
+
+
+def _at_exit():
+    # Pending saves first, as they may leave writes to sync
+    for saver in list(_savers):
+        saver.flush()
+    for writer in list(_writers):
+        writer.sync()
+
+
+atexit.register(_at_exit)
+
+
+def content_digest(data):
+    """Hash bytes the way AtomicWriter does to detect unchanged contents."""
+    return hashlib.blake2b(data, digest_size=16).digest()
+
+
+def file_digest(path):
+    with open(path, "rb") as file:
+        return content_digest(file.read())
+
+
+def _mode(path):
+    # Keep the permissions of the file being replaced; mkstemp's are 0600
+    try:
+        return os.stat(path).st_mode & 0o7777
+    except OSError:
+        umask = os.umask(0)
+        os.umask(umask)
+        return 0o666 & ~umask
+
+
+def _fsync_dir(directory):
+    # Makes a rename durable; not possible (or needed) on Windows
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+class AtomicWriter:
+    """Replace a file's contents atomically.
+
+    Each write goes to a temporary file in the same directory which is then
+    renamed over ``path``, so a crash mid-write leaves either the old or the
+    new contents, never a truncated file. If ``path`` is a symlink, the file
+    it points to is replaced and the link is kept. Writes whose bytes hash the same as
+    the last ones written are skipped.
+
+    ``fsync_interval`` controls durability against power loss: 0 fsyncs every
+    write, a number of seconds fsyncs at most that often (call sync() to force
+    the latest write to disk), and None never fsyncs.
+    """
+
+    def __init__(self, path, fsync_interval=0):
+        self.path = path
+        self.fsync_interval = fsync_interval
+        self.digest = None
+        self._last_sync = None
+        self._unsynced = False
+        _writers.add(self)
+
+    def write(self, data):
+        """Write ``data`` (bytes) to the file. Returns False if it was unchanged."""
+        digest = content_digest(data)
+        if digest == self.digest and os.path.exists(self.path):
+            return False
+
+        # Replace what a symlink points to rather than the link itself, and
+        # from the target's directory, so the rename stays on one filesystem
+        path = os.path.realpath(self.path)
+        directory = os.path.dirname(path)
+        fsync = self._fsync_due()
+        fd, temp_path = tempfile.mkstemp(
+            dir=directory, prefix=f".{os.path.basename(path)}.", suffix=".tmp"
+        )
+        try:
+            with os.fdopen(fd, "wb") as file:
+                file.write(data)
+                if fsync:
+                    file.flush()
+                    os.fsync(file.fileno())
+            os.chmod(temp_path, _mode(path))
+            os.replace(temp_path, path)
+        except BaseException:
+            try:
+                os.unlink(temp_path)
+            except OSError:
+                pass
+            raise
+
+        self.digest = digest
+        if fsync:
+            _fsync_dir(directory)
+            self._last_sync = time.monotonic()
+            self._unsynced = False
+        else:
+            self._unsynced = self.fsync_interval is not None
+        return True
+
+    def sync(self):
+        """Flush a write whose fsync was batched to disk."""
+        if not self._unsynced:
+            return
+        self._unsynced = False
+        path = os.path.realpath(self.path)
+        try:
+            fd = os.open(path, os.O_RDONLY)
+        except OSError:
+            return
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+        _fsync_dir(os.path.dirname(path))
+        self._last_sync = time.monotonic()
+
+    def _fsync_due(self):
+        if self.fsync_interval is None:
+            return False
+        if not self.fsync_interval or self._last_sync is None:
+            return True
+        return time.monotonic() - self._last_sync >= self.fsync_interval
+
+
+class WriteBehindSaver:
+    """Coalesce bursts of change notifications into a single deferred save.
+
+    The first change starts a timer of ``delay`` seconds; any further changes
+    made before it fires are folded into the same write. At most one write is
+    in flight at a time, and changes made while a write is running schedule
+    exactly one follow-up write.
+
+    If ``save_async`` is given, the timer awaits it instead of calling
+    ``save``, which is still used by flush() since that has to finish before
+    returning.
+    """
+
+    def __init__(self, save, delay, save_async=None):
+        self._save = save
+        self._save_async = save_async
+        self.delay = delay
+        self._dirty = False
+        self._handle = None
+        self._task = None
+        self._waiters = []
+        _savers.add(self)
+
+    @property
+    def pending(self):
+        return self._dirty or self._task is not None
+
+    def schedule(self):
+        self._dirty = True
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # Outside the event loop (scripts, shutdown) there is nothing to
+            # defer to, so write straight away.
+            self.flush()
+            return
+
+        if self._handle is None and self._task is None:
+            self._handle = loop.call_later(self.delay, self._start)
+
+    def _start(self):
+        self._handle = None
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def _run(self):
+        try:
+            while self._dirty:
+                self._dirty = False
+                result = (self._save_async or self._save)()
+                if asyncio.iscoroutine(result):
+                    await result
+        finally:
+            self._task = None
+            self._wake_waiters()
+
+    def flush(self):
+        """Write any pending changes now, without waiting for the timer."""
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+        # A write still running in the background only covers what changed
+        # before it started, so anything since is saved now as well
+        if self._dirty:
+            self._dirty = False
+            result = self._save()
+            if asyncio.iscoroutine(result):
+                # Only reachable outside the loop, e.g. from atexit.
+                asyncio.run(result)
+        self._wake_waiters()
+
+    def cancel(self):
+        """Forget pending changes without writing them."""
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+        self._dirty = False
+        self._wake_waiters()
+
+    async def saved(self):
+        """Wait until every change made so far has been written."""
+        while self.pending:
+            if self._handle is None and self._task is None:
+                self.flush()
+                continue
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters.append(waiter)
+            await waiter
+
+    def _wake_waiters(self):
+        if self.pending:
+            return
+        waiters, self._waiters = self._waiters, []
+        for waiter in waiters:
+            if not waiter.done():
+                waiter.set_result(None)
@@ -1,7 +1,59 @@
+import fnmatch
+import re
+import sqlite3
+from contextlib import contextmanager
+
 import yaml
-from schema import Schema, SchemaError
+from schema import SchemaError
+
+from .backends import FileBackend
+from .compiled import compile_schema
+from .instrumentation import Instruments, Recorder, count_values
+from .journal import Journal
+from .nodes import (
+    DictNode,
+    _copy_tree,
+    _same_kind,
+    create_node,
+    held_notifications,
+)
+from .saver import WriteBehindSaver
+from .serializers import default_serializer
+from .snapshot import Snapshot
+from .validation import IncrementalValidator, RemovalChecker, match_key
+
+# Returned by a background write when an incremental update didn't apply
+_REWRITE = object()
+
+_MISSING = object()
+_WILDCARDS = re.compile(r"[*?[]")
+
+
+def _split_path(path):
+    if isinstance(path, str):
+        return tuple(path.split(".")) if path else ()
+    return tuple(path)
+
 
-from .nodes import DictNode, create_node
+def _child(node, key):
+    if isinstance(key, str) and key.isdigit() and isinstance(node.value, list):
+        key = int(key)
+    return node.child(key)
+
+
+def _descendants(nodes):
+    # The nodes and everything below them, in tree order, each once
+    seen = set()
+    found = []
+    stack = list(reversed(nodes))
+    while stack:
+        node = stack.pop()
+        if id(node) in seen:
+            continue
+        seen.add(id(node))
+        found.append(node)
+        stack.extend(reversed(node.children))
+    return found
 
 
 class SchemaNode(DictNode):
@@ -14,17 +66,24 @@ class SchemaNode(DictNode):
         schema=None,
         path=(),
         defaults_dict={},
+        lazy=False,
     ):
         if parent is None:
             self.defaults = defaults_dict
-        super().__init__(key, value, parent, keyschema, schema, path)
+        super().__init__(key, value, parent, keyschema, schema, path, lazy=lazy)
 
     def on_add(self, node, default_value):
         if isinstance(node.value, list):
             return node.add_list_item(default_value)
+        for child in node._children or ():
+            child.notify("remove_node", key=child.key)
         node.value = default_value
+        # Build the children afresh; reading node.children first would
+        # materialise a lazy node's children from the new value as well
+        node._children = []
+        node._index = None
         for key, value in default_value.items():
-            child_keyschema, child_schema = node._get_child_schemas(key)
+            schema_key, child_keyschema, child_schema = node._get_child_schemas(key)
             child = create_node(
                 key,
                 value,
@@ -32,14 +91,25 @@ class SchemaNode(DictNode):
                 keyschema=child_keyschema,
                 schema=child_schema,
                 path=self.path,
+                schema_key=schema_key,
             )
             node.children.append(child)
-        node.notify("add_node", child=child)
+            node._index_child(child)
+            node.notify("add_node", child=child)
 
     def on_remove(self, node):
         if node.parent:
+            siblings = node.parent.children
             del node.parent.value[node.key]
-            node.parent.children.remove(node)
+            if isinstance(node.parent.value, list):
+                # Keys are list indices, so the node is found without a search;
+                # keep them equal to the indices of the items that moved up
+                del siblings[node.key]
+                for index in range(node.key, len(siblings)):
+                    siblings[index].key = index
+            else:
+                siblings.remove(node)
+                node.parent._unindex_child(node.key)
         node.notify("remove_node", key=node.key)
 
 
@@ -52,108 +122,1107 @@ class SchemaDataSource(SchemaNode):
         yaml_file,
         defaults_dict={},
         example_yaml=None,
+        save_delay=None,
+        incremental_validation=True,
+        lazy=False,
+        fsync_interval=0,
+        serializer=None,
+        backend=None,
+        journal=False,
+        compact_every=1000,
+        snapshot=None,
+        background_save=False,
+        instruments=None,
+        publisher=None,
+        publish_delay=1.0,
+        history=None,
     ):
-        self.schema = schema
         self.yaml_file = yaml_file
         self.example_yaml = example_yaml
+        self.serializer = serializer or default_serializer
+        # Times loading, validating and saving, when given sinks to report to
+        self.instruments = instruments if instruments is not None else Instruments()
+        # Where the settings are stored. By default that's yaml_file, replaced
+        # atomically and only when the dumped YAML has changed; fsync_interval
+        # batches fsyncs (see AtomicWriter).
+        self.backend = backend or FileBackend(
+            yaml_file, self.serializer, fsync_interval, self.instruments
+        )
+        # Backends that support it only get sent the leaves changed since the
+        # last save, unless the structure of the tree has changed as well
+        # (_leaves is None then).
+        self._rewrite = True
+        self._leaves = {}
+        # With journal=True, saves append the edits to a log next to the file
+        # and the file itself is only rewritten every compact_every edits.
+        self.journal = None
+        self.compact_every = compact_every
+        self._operations = []
+        if journal:
+            if not isinstance(self.backend, FileBackend):
+                raise ValueError("Journaling needs a file backend")
+            self.journal = Journal(self.backend.path)
+        # A Snapshot to refresh whenever the whole file is written
+        self.snapshot = snapshot
+        # A Publisher to share each saved state with other processes. Writing
+        # the whole file publishes what was written; smaller saves leave it
+        # to a timer, as publishing copies and encodes all of the settings.
+        self.publisher = publisher
+        self._publisher_timer = None
+        if publisher is not None:
+            self._publisher_timer = WriteBehindSaver(
+                lambda: self._publish(self.to_dict()), publish_delay
+            )
+        # An UndoHistory to record edits in, so they can be undone
+        self.history = history
+        # The operations that undo the edits of the current transaction()
+        self._rollback = None
+        # With a save_delay, edits are written behind on the event loop instead
+        # of rewriting the file on every change. With background_save they
+        # are validated and written on a worker thread as well (see
+        # save_async), so they never hold up the event loop.
+        self.saver = None
+        if save_delay is not None or background_save:
+            self.saver = WriteBehindSaver(
+                self.save,
+                save_delay or 0,
+                self.save_async if background_save else None,
+            )
+        # Background writes, in the order they were started; a single worker
+        # thread runs them, so they reach the disk in that order too.
+        self._writer = None
+        self._writes = []
+        # Inside batch(), saves wait until the outermost batch ends
+        self._batch_depth = 0
+        self._save_requested = False
+        # Notifications queued by the current batch (see held_notifications)
+        self._held = None
+        # Tracks which nodes changed so saves only revalidate those paths. Set
+        # incremental_validation=False to validate the whole document instead.
+        self.validation = IncrementalValidator(self, incremental_validation)
+        self.removal = RemovalChecker()
         super().__init__(
-            settings_name, data, schema=schema, defaults_dict=defaults_dict
+            settings_name,
+            data,
+            schema=schema,
+            defaults_dict=defaults_dict,
+            lazy=lazy,
         )
+        if publisher is not None:
+            self._publish(self.to_dict())
 
     @staticmethod
     def validate_data(data, schema):
         try:
-            Schema(schema).validate(data)
+            compile_schema(schema)(data)
         except SchemaError as e:
             raise ValueError(f"Data does not match schema: {e}")
 
     @classmethod
     def from_yaml(
-        cls, settings_name, yaml_file, schema, defaults_dict={}, example_yaml=None
+        cls,
+        settings_name,
+        yaml_file,
+        schema,
+        defaults_dict={},
+        example_yaml=None,
+        save_delay=None,
+        incremental_validation=True,
+        lazy=False,
+        fsync_interval=0,
+        serializer=None,
+        journal=False,
+        compact_every=1000,
+        snapshot=False,
+        background_save=False,
+        instruments=None,
+        publisher=None,
+        publish_delay=1.0,
+        history=None,
     ):
         """Create a SchemaDataSource from a YAML file.
 
         If the yaml_file doesn't exist and example_yaml is provided, the example
         will be copied to yaml_file after validation.
+
+        If save_delay is given, changes are coalesced and saved at most once
+        every save_delay seconds; use flush() or ``await saved()`` to force
+        them to disk. With lazy=True, nodes below the root are only built once
+        something (usually the settings widget) looks at them. Saves are
+        always atomic; fsync_interval is the minimum number of seconds between
+        fsyncs (0 for every save, None to leave it to the OS). The serializer
+        (a YamlSerializer by default) reads and writes the file.
+
+        With journal=True, each save appends the edits to ``<yaml_file>.journal``
+        instead, and the file is rewritten once compact_every edits have been
+        logged. Edits left in the journal are applied when the file is next
+        loaded, whether or not journaling is enabled then.
+
+        With snapshot=True, the validated contents are also cached in
+        ``<yaml_file>.snapshot`` (see Snapshot), and later loads use that
+        instead of parsing and validating the file for as long as neither the
+        file nor the schema changes.
+
+        With background_save=True, saves triggered by edits run on a worker
+        thread (see save_async). Use load() to read the file off the event
+        loop as well.
+
+        ``instruments`` (see Instruments) times loading the file, and the
+        source's validation and saves from then on.
+
+        With a ``publisher`` (see Publisher), the settings are published for
+        other processes to read once loaded, and again after every save. As
+        that means copying and encoding all of them, saves that only append
+        to the journal or update the changed leaves publish at most every
+        ``publish_delay`` seconds instead, on the event loop (or straight
+        away outside one), while rewriting the whole file publishes at once.
+        With a ``history`` (see UndoHistory), edits can be undone and redone.
         """
-        import os
-        import shutil
+        serializer = serializer or default_serializer
+        data, replayed, snapshot, events = _read_yaml(
+            yaml_file,
+            schema,
+            example_yaml,
+            serializer,
+            snapshot,
+            instruments is not None,
+        )
+        return cls._create(
+            data,
+            replayed,
+            events,
+            settings_name,
+            yaml_file,
+            schema,
+            defaults_dict=defaults_dict,
+            example_yaml=example_yaml,
+            save_delay=save_delay,
+            incremental_validation=incremental_validation,
+            lazy=lazy,
+            fsync_interval=fsync_interval,
+            serializer=serializer,
+            journal=journal,
+            compact_every=compact_every,
+            snapshot=snapshot,
+            background_save=background_save,
+            instruments=instruments,
+            publisher=publisher,
+            publish_delay=publish_delay,
+            history=history,
+        )
 
-        if not os.path.exists(yaml_file):
-            if example_yaml is None:
-                raise FileNotFoundError(
-                    f"Settings file {yaml_file} not found and no example file provided"
-                )
+    @classmethod
+    async def load(cls, *args, executor=None, **kwargs):
+        """Create a SchemaDataSource from a YAML file without blocking the loop.
 
-            if not os.path.exists(example_yaml):
-                raise FileNotFoundError(f"Example file {example_yaml} not found")
+        Takes the same arguments as from_yaml. Reading, parsing and validating
+        the file run in ``executor`` (the event loop's default thread pool if
+        None), and building the nodes in the default pool. With a process
+        pool the schema and serializer must be picklable.
+        """
+        import asyncio
+        import functools
+        import inspect
 
-            # Validate example file first
-            with open(example_yaml) as file:
-                example_data = yaml.safe_load(file)
-            cls.validate_data(example_data, schema)
+        arguments = inspect.signature(cls.from_yaml).bind(*args, **kwargs)
+        arguments.apply_defaults()
+        options = arguments.arguments
+        options["serializer"] = options["serializer"] or default_serializer
 
-            # Create directory if it doesn't exist
-            os.makedirs(os.path.dirname(yaml_file), exist_ok=True)
+        loop = asyncio.get_running_loop()
+        data, replayed, options["snapshot"], events = await loop.run_in_executor(
+            executor,
+            functools.partial(
+                _read_yaml,
+                options["yaml_file"],
+                options["schema"],
+                options["example_yaml"],
+                options["serializer"],
+                options["snapshot"],
+                options["instruments"] is not None,
+            ),
+        )
+        return await loop.run_in_executor(
+            None, functools.partial(cls._create, data, replayed, events, **options)
+        )
 
-            # Copy validated example file
-            shutil.copy2(example_yaml, yaml_file)
-            data = example_data
-        else:
+    @classmethod
+    def _create(
+        cls, data, replayed, events, settings_name, yaml_file, schema, **options
+    ):
+        instruments = options.get("instruments")
+        if instruments is None:
+            instruments = options["instruments"] = Instruments()
+        # Loading may have run in another process, so was timed separately
+        instruments.replay(events)
+        info = {"nodes": count_values(data)} if instruments.enabled else {}
+        with instruments.span("build", **info):
+            source = cls(settings_name, data, schema, yaml_file, **options)
+        # The data was validated above, so the first save needn't redo it
+        source.validation.clear()
+        source._rewrite = False
+        if replayed:
+            source._compact_journal()
+        return source
+
+    @classmethod
+    def from_backend(
+        cls,
+        settings_name,
+        backend,
+        schema,
+        defaults_dict={},
+        example_yaml=None,
+        save_delay=None,
+        incremental_validation=True,
+        lazy=False,
+        serializer=None,
+        journal=False,
+        compact_every=1000,
+        background_save=False,
+        instruments=None,
+        publisher=None,
+        publish_delay=1.0,
+        history=None,
+    ):
+        """Create a SchemaDataSource from settings kept in a storage backend.
+
+        This works like from_yaml: if the backend is empty, or holds settings
+        that don't match the schema (which are backed up first), it is filled
+        from example_yaml, read with ``serializer``. Journaling is only
+        available for file backends. To time serialising and writing a file,
+        give its FileBackend the same ``instruments``.
+        """
+        import os
+
+        if instruments is None:
+            instruments = Instruments()
+        serializer = serializer or default_serializer
+        data = None
+        replayed = 0
+        if backend.exists():
             try:
-                with open(yaml_file) as file:
-                    data = yaml.safe_load(file)
-                # Validate existing file
-                cls.validate_data(data, schema)
+                with instruments.span("parse"):
+                    data = backend.load()
+                if isinstance(backend, FileBackend):
+                    pending = Journal(backend.path)
+                    data, replayed = _replay(pending, data, schema, instruments)
+                if not replayed:
+                    instruments.count("validations")
+                    with instruments.span("validate", full=True):
+                        cls.validate_data(data, schema)
             except (yaml.YAMLError, ValueError) as e:
                 if example_yaml is None:
                     raise ValueError(
-                        f"Invalid YAML file {yaml_file} and no example file provided: {e}"
+                        f"Invalid settings in {backend.path} and no example file provided: {e}"
                     )
+                backup_file = backend.backup()
+                print(
+                    f"Invalid settings backed up to {backup_file} and replaced with example file"
+                )
+                data = None
+        elif example_yaml is None:
+            raise FileNotFoundError(
+                f"Settings in {backend.path} not found and no example file provided"
+            )
 
-                # Backup the invalid file
-                backup_file = f"{yaml_file}.backup"
-                import shutil
+        if data is None:
+            if not os.path.exists(example_yaml):
+                raise FileNotFoundError(f"Example file {example_yaml} not found")
+            with open(example_yaml, "rb") as file:
+                data = serializer.load(file)
+            cls.validate_data(data, schema)
+            backend.save(data)
 
-                shutil.copy2(yaml_file, backup_file)
+        info = {"nodes": count_values(data)} if instruments.enabled else {}
+        with instruments.span("build", **info):
+            source = cls(
+                settings_name,
+                data,
+                schema,
+                backend.path,
+                defaults_dict=defaults_dict,
+                example_yaml=example_yaml,
+                save_delay=save_delay,
+                incremental_validation=incremental_validation,
+                lazy=lazy,
+                serializer=serializer,
+                backend=backend,
+                journal=journal,
+                compact_every=compact_every,
+                background_save=background_save,
+                instruments=instruments,
+                publisher=publisher,
+                publish_delay=publish_delay,
+                history=history,
+            )
+        source.validation.clear()
+        source._rewrite = False
+        if replayed:
+            source._compact_journal()
+        return source
 
-                # Load and validate example file
-                with open(example_yaml) as file:
-                    example_data = yaml.safe_load(file)
-                cls.validate_data(example_data, schema)
+    def validate_changes(self, data=None):
+        validation = self.validation
+        if not (validation.full or validation.pending):
+            return
+        self.instruments.count("validations")
+        with self.instruments.span(
+            "validate", full=validation.full, changes=validation.pending
+        ):
+            try:
+                validation.validate(data)
+            except SchemaError as e:
+                raise ValueError(f"Data does not match schema: {e}")
 
-                # Copy validated example file
-                shutil.copy2(example_yaml, yaml_file)
-                data = example_data
-                print(
-                    f"Invalid YAML file backed up to {backup_file} and replaced with example file"
-                )
+    def save(self):
+        """Validate the changes since the last save and store them."""
+        self._collect_writes(wait=True)
+        try:
+            write = self._begin_save()
+        except (ValueError, OSError, sqlite3.Error) as e:
+            print(f"Error saving file: {e}")
+            return
+        if write is not None:
+            self._finish_save(write())
 
-        return cls(
-            settings_name,
-            data,
-            schema,
-            yaml_file,
-            defaults_dict=defaults_dict,
-            example_yaml=example_yaml,
-        )
+    async def save_async(self):
+        """Like save(), but validate and write the settings on a worker thread.
+
+        Only copying the changed values out of the node tree, and checking
+        them when that can be done a node at a time, happens on the event
+        loop; validating the whole document, serialising it and writing it
+        happen on the thread.
+        """
+        import asyncio
+        from concurrent.futures import ThreadPoolExecutor
 
-    def save_to_yaml(self):
-        data = self.to_dict()
         try:
-            self.validate_data(data, self.schema)
-            with open(self.yaml_file, "w") as file:
-                yaml.dump(data, file)
-        except ValueError as e:
+            write = self._begin_save()
+        except (ValueError, OSError, sqlite3.Error) as e:
             print(f"Error saving file: {e}")
+            return
+        if write is None:
+            return
+        if self._writer is None:
+            self._writer = ThreadPoolExecutor(
+                max_workers=1, thread_name_prefix="settings-save"
+            )
+        future = self._writer.submit(write)
+        self._writes.append(future)
+        await asyncio.wrap_future(future)
+        self._collect_writes()
+
+    def _begin_save(self):
+        # The part of a save that reads the node tree, which has to happen on
+        # the event loop. Returns a function that does the rest, working only
+        # on copies, or None if there's nothing left to do.
+        if self.journal is not None:
+            # A rewrite still running would clear entries appended now
+            self._collect_writes(wait=True)
+            if self._append_to_journal():
+                if self.publisher is not None:
+                    self._publisher_timer.schedule()
+                return None
+
+        instruments = self.instruments
+        data = leaves = schema = None
+        if self._rewrite or self._leaves is None or not self.backend.incremental:
+            with instruments.span("to_dict"):
+                data = self.to_dict()
+        else:
+            leaves = [(node.key_path, node.value) for node in self._leaves.values()]
+        if self.publisher is not None:
+            if data is None:
+                self._publisher_timer.schedule()
+            else:
+                self._publisher_timer.cancel()  # The write publishes data
+        if self.validation.full:
+            # Left to the worker; checking the whole document is the slow part
+            schema = self.schema
+            self.validation.clear()
+        else:
+            self.validate_changes()
+        self._rewrite = False
+        self._leaves = {}
+        self._operations = []
+
+        def write():
+            info = {}
+            if instruments.enabled:
+                if leaves is None:
+                    info["nodes"] = count_values(data)
+                else:
+                    info["leaves"] = len(leaves)
+            try:
+                with instruments.span("save", **info):
+                    if schema is not None:
+                        instruments.count("validations")
+                        with instruments.span("validate", full=True):
+                            self.validate_data(data, schema)
+                    if leaves is not None:
+                        if not self.backend.update(leaves):
+                            return _REWRITE
+                    else:
+                        self.backend.save(data)
+                        if self.snapshot is not None:
+                            self.snapshot.store(data)
+                        if self.journal is not None:
+                            self.journal.clear()
+                instruments.count("saves")
+                if self.publisher is not None and data is not None:
+                    self._publish(data)
+            except (ValueError, OSError, sqlite3.Error) as e:
+                return e
+
+        return write
+
+    def _publish(self, data):
+        with self.instruments.span("publish") as span:
+            span.set(bytes=self.publisher.publish(data))
+
+    def _finish_save(self, error):
+        if error is None:
+            return
+        if error is not _REWRITE:
+            print(f"Error saving file: {error}")
+            self.validation.mark_all()
+        # Whatever the failed write held is saved by writing everything
+        self._rewrite = True
+        if error is _REWRITE:
+            self._request_save()
+
+    def _collect_writes(self, wait=False):
+        # Handle the results of background writes that have finished, or of
+        # all of them if wait is True
+        while self._writes and (wait or self._writes[0].done()):
+            self._finish_save(self._writes.pop(0).result())
+
+    def _append_to_journal(self):
+        # Returns False if the whole file needs writing instead
+        base = self.backend.digest()
+        if self._rewrite or base is None:
+            return False
+        self.validate_changes()
+        if self._operations:
+            try:
+                self.journal.append(self._operations, base.hex())
+            except (TypeError, ValueError):
+                # Values JSON can't represent exactly, so write them all
+                self._rewrite = True
+                return False
+            self._operations = []
+        self._leaves = {}
+        return self.journal.entries < self.compact_every
 
-    def on_change(self):
+    def save_to_yaml(self):
+        """Validate and store all of the settings."""
+        self._rewrite = True
+        self.save()
+
+    async def save_to_yaml_async(self):
+        """Like save_to_yaml(), but off the event loop (see save_async)."""
+        self._rewrite = True
+        await self.save_async()
+
+    def _compact_journal(self):
+        # Fold replayed edits into the file, then drop the log. If saving
+        # fails the log is kept and replayed again next time.
+        journal = self.journal or Journal(self.backend.path)
         self.save_to_yaml()
+        if not self._rewrite:
+            journal.clear()
+
+    def reload(self, data=None):
+        """Bring the tree up to date with the stored settings.
+
+        This is for when another program has changed them. ``data`` is what
+        is stored now, read from the backend if not given, and must already
+        have been validated if it is. Only nodes whose values differ are
+        touched, and listeners hear about each of them (see reconcile). Edits
+        that haven't been saved yet are lost. Returns the number of
+        notifications sent.
+        """
+        self._collect_writes(wait=True)
+        if data is None:
+            data = self.backend.load()
+            self.validate_data(data, self.schema)
+        if self.saver is not None:
+            self.saver.cancel()
+        with self.instruments.span("reconcile") as span:
+            notified = self.reconcile(data)
+            span.set(notifications=notified)
+        if self.publisher is not None:
+            self._publisher_timer.cancel()
+            self._publish(data)
+        self._forget()  # Edits made to what was stored before
+        # The tree now matches what's stored, so there's nothing to save
+        self.validation.clear()
+        self.removal.clear()
+        self._rewrite = False
+        self._leaves = {}
+        self._operations = []
+        if self.journal is not None:
+            self.journal.clear()  # Made against the file as it was
+        return notified
+
+    def replace(self, data):
+        """Replace all of the settings with ``data``.
+
+        Like reload(), this only touches the nodes whose values differ, but
+        the result counts as an edit: it is validated and stored by the next
+        save (save_to_yaml() or save_to_yaml_async() to save it right away).
+        Returns the number of notifications sent.
+        """
+        if self._recording():
+            self._record(("set", (), self.to_dict()), ("set", (), data))
+            data = _copy_tree(data)  # The recorded copy mustn't change
+        with self.instruments.span("reconcile") as span:
+            notified = self.reconcile(data)
+            span.set(notifications=notified)
+        self.validation.mark_all()
+        self.removal.clear()
+        self._rewrite = True
+        self._leaves = None
+        return notified
+
+    @contextmanager
+    def batch(self):
+        """Make a number of changes as one.
+
+        Inside ``with source.batch():`` listeners aren't notified until the
+        block ends, when repeated changes to the same node are sent once (see
+        held_notifications), and the changes are validated and saved once
+        instead of after each of them. Batches can be nested; only the
+        outermost one counts.
+        """
+        self._batch_depth += 1
+        if self.history is not None:
+            self.history.begin()
+        try:
+            with held_notifications(self):
+                yield self
+        finally:
+            if self.history is not None:
+                self.history.end()
+            self._batch_depth -= 1
+            if not self._batch_depth and self._save_requested:
+                self._save_requested = False
+                self._request_save()
+
+    @contextmanager
+    def transaction(self):
+        """Like batch(), but all or nothing.
+
+        The changes are validated when the block ends. If that fails, or the
+        block raises, the settings are put back as they were, nothing is
+        saved, and the error is raised (validation errors as ValueError).
+        The changes are put back by undoing each of them in turn, so a small
+        transaction costs little however big the settings are.
+        """
+        state = (
+            self._rewrite,
+            None if self._leaves is None else dict(self._leaves),
+            list(self._operations),
+            self.validation.checkpoint(),
+            self._save_requested,
+        )
+        outer, self._rollback = self._rollback, []
+        with self.batch():
+            recorded = self.history.checkpoint() if self.history else None
+            try:
+                yield self
+                self.validate_changes()
+            except BaseException:
+                operations, self._rollback = self._rollback, None
+                try:
+                    self._undo_all(operations)
+                finally:
+                    self._rollback = outer
+                if self.history is not None:
+                    self.history.rollback(recorded)
+                (
+                    self._rewrite,
+                    self._leaves,
+                    self._operations,
+                    checkpoint,
+                    self._save_requested,
+                ) = state
+                self.validation.restore(checkpoint)
+                self.removal.clear()
+                raise
+            else:
+                if outer is not None:
+                    outer.extend(self._rollback)  # For the enclosing transaction
+                self._rollback = outer
+
+    def _undo_all(self, operations):
+        for operation in reversed(operations):
+            if operation is None:
+                print("Could not roll back changes made before an untracked change")
+                return
+            self._apply(operation)
+
+    def find(self, path):
+        """Return the node at ``path``, or raise KeyError.
+
+        A path is a sequence of keys and list indices, or a string of them
+        joined by dots, like ``"servers.main.port"``; in strings, numbers are
+        taken as list indices where the node is a list. Dict children are
+        looked up by key and list items by position, so this takes time
+        proportional to the path's length, not the size of the tree.
+        """
+        node = self
+        for key in _split_path(path):
+            node = _child(node, key)
+        return node
+
+    def get(self, path, default=_MISSING):
+        """Return a copy of the value at ``path`` (see find)."""
+        try:
+            return self.find(path).to_dict()
+        except KeyError:
+            if default is _MISSING:
+                raise
+            return default
+
+    def set(self, path, value):
+        """Set the value at ``path`` (see find) and save it, as an edit would.
+
+        The value is validated first, and ValueError raised if it doesn't
+        match its schema. A key that doesn't exist yet is added to its dict,
+        and a list can be extended by setting the index one past its end.
+        Only the nodes whose values change are touched (see reconcile).
+        """
+        keys = _split_path(path)
+        if not keys:
+            self.validate_data(value, self.schema)
+            self.replace(value)
+            self._request_save()
+            return
+
+        parent = self.find(keys[:-1])
+        key = keys[-1]
+        try:
+            node = _child(parent, key)
+        except KeyError:
+            node = None
+        if node is None:
+            self._add_child(parent, key, value)
+            return
+
+        error = node.validator(value)
+        if error:
+            raise ValueError(error)
+        old_value = node.to_dict() if self._recording() else None
+        if _same_kind(node.value, value):
+            notified = node.reconcile(value)
+        else:
+            index = parent.children.index(node)
+            notified = parent._reconcile_child(index, node, value)
+            node = parent.children[index]
+        if notified:
+            self.on_change(node, old_value=old_value)
+
+    def _add_child(self, parent, key, value, index=None):
+        # Add a child at index, or the end, as an edit; lists only take their
+        # index as the key
+        if isinstance(parent.value, list):
+            if isinstance(key, str) and key.isdigit():
+                key = int(key)
+            if type(key) is not int or not 0 <= key <= len(parent.value):
+                raise KeyError(key)
+            index = key
+        elif isinstance(parent.value, dict):
+            if isinstance(parent.schema, dict):
+                try:
+                    match_key(parent.schema, key)
+                except SchemaError as e:
+                    raise ValueError(f"Key not allowed: {e}")
+        else:
+            raise KeyError(key)
+
+        child = parent._create_child(key, value)
+        for validator, checked in (
+            (child.key_validator, key),
+            (child.validator, value),
+        ):
+            error = validator(checked)
+            if error:
+                raise ValueError(error)
+        siblings = parent.children
+        if index is None or index >= len(siblings):
+            index = len(siblings)
+            if isinstance(parent.value, list):
+                parent.value.append(value)
+            else:
+                parent.value[key] = value
+            siblings.append(child)
+        elif isinstance(parent.value, list):
+            parent.value.insert(index, value)
+            siblings.insert(index, child)
+            for position in range(index + 1, len(siblings)):
+                siblings[position].key = position
+        else:
+            items = list(parent.value.items())
+            items.insert(index, (key, value))
+            parent.value.clear()
+            parent.value.update(items)
+            siblings.insert(index, child)
+        parent._index_child(child)
+        parent.notify("add_node", parent=parent, index=index, child=child)
+
+        if self._recording():
+            self._record(
+                ("remove", child.key_path),
+                ("insert", parent.key_path, index, key, child.to_dict()),
+            )
+        self._mark_changed(child, is_key=True)
+        if self.journal is not None:
+            self._operations.append(
+                {"op": "add", "path": list(child.key_path), "value": child.to_dict()}
+            )
+        self._request_save()
+
+    def delete(self, path):
+        """Remove the node at ``path`` (see find) and save, as an edit would.
+
+        Raises ValueError if the schema requires it.
+        """
+        node = self.find(path)
+        if node is self or not self.can_remove(node):
+            raise ValueError(f"{path!r} is required by the schema")
+        self.on_remove(node)
+
+    def select(self, pattern):
+        """Return the nodes whose paths match ``pattern``, in tree order.
+
+        The pattern is a path (see find) in which a key can contain fnmatch
+        style wildcards, matching the keys of a node's children as strings,
+        and ``**`` matches any number of keys, so ``"servers.*.port"`` selects
+        the port of every server and ``"**.port"`` every port.
+        """
+        nodes = [self]
+        for key in _split_path(pattern):
+            if key == "**":
+                nodes = _descendants(nodes)
+            elif isinstance(key, str) and _WILDCARDS.search(key):
+                nodes = [
+                    child
+                    for node in nodes
+                    for child in node.children
+                    if fnmatch.fnmatchcase(str(child.key), key)
+                ]
+            else:
+                found = []
+                for node in nodes:
+                    try:
+                        found.append(_child(node, key))
+                    except KeyError:
+                        pass
+                nodes = found
+        return nodes
+
+    def undo(self):
+        """Undo the last edit recorded in the history (see UndoHistory).
+
+        The settings are changed back the same way edits change them, so
+        listeners only hear about the nodes involved, and the result is
+        validated and saved like an edit. Returns False if there was nothing
+        to undo.
+        """
+        if self.history is None:
+            return False
+        with self.batch():
+            return self.history.undo(self._apply)
+
+    def redo(self):
+        """Redo the last edit undone, like undo()."""
+        if self.history is None:
+            return False
+        with self.batch():
+            return self.history.redo(self._apply)
+
+    def _apply(self, operation):
+        kind, path, *arguments = operation
+        if kind == "set":
+            self.set(path, arguments[0])
+        elif kind == "insert":
+            index, key, value = arguments
+            self._add_child(self.find(path), key, value, index)
+        elif kind == "remove":
+            self.on_remove(self.find(path))
+        elif kind == "rename":
+            node = self.find(path)
+            old_key = node.key
+            node.rename(arguments[0])
+            node.notify("change_node", item=node)
+            self.on_change(node, is_key=True, old_key=old_key)
+        else:
+            raise ValueError(f"Unknown operation {kind!r}")
+
+    def can_remove(self, node):
+        """Can ``node`` be removed and leave its parent valid?"""
+        return self.removal.can_remove(node)
+
+    def on_change(self, node=None, is_key=False, old_key=None, old_value=_MISSING):
+        """Record that ``node`` has been changed, and save it.
+
+        For a new key, pass ``is_key=True`` and the ``old_key``, and for a new
+        value the ``old_value``, so the edit can be undone; without those the
+        history (if any) is cleared. With no node, everything is saved.
+        """
+        if self._recording():
+            self._record_change(node, is_key, old_key, old_value)
+        if node is None:
+            self.validation.mark_all()
+            self.removal.clear()
+            self._rewrite = True
+        else:
+            self._mark_changed(node, is_key)
+            if self.journal is not None:
+                if is_key and old_key is not None:
+                    path = list(node.key_path)
+                    self._operations.append(
+                        {"op": "move", "from": path[:-1] + [old_key], "path": path}
+                    )
+                else:
+                    if is_key:
+                        node = node.parent
+                    self._operations.append(
+                        {
+                            "op": "replace",
+                            "path": list(node.key_path),
+                            "value": node.to_dict(),
+                        }
+                    )
+        self._request_save()
+
+    def _recording(self):
+        # Do edits need recording, for undo() or to roll back a transaction?
+        return self.history is not None or self._rollback is not None
+
+    def _record(self, undo, redo):
+        if self._rollback is not None:
+            self._rollback.append(undo)
+        if self.history is not None:
+            self.history.record(undo, redo)
+
+    def _forget(self):
+        # After an edit that can't be undone, the edits before it can't be
+        # either; a transaction can only roll back as far as this
+        if self._rollback is not None:
+            self._rollback.append(None)
+        if self.history is not None:
+            self.history.clear()
+
+    def _record_change(self, node, is_key, old_key, old_value):
+        if node is None or (old_key is None if is_key else old_value is _MISSING):
+            self._forget()
+            return
+        path = node.key_path
+        if is_key:
+            self._record(
+                ("rename", path, old_key), ("rename", path[:-1] + (old_key,), node.key)
+            )
+        else:
+            self._record(("set", path, old_value), ("set", path, node.to_dict()))
+
+    def _mark_changed(self, node, is_key=False):
+        if is_key:
+            self.validation.mark(node.parent, keys=True)
+            self.removal.changed(node.parent)
+        self.validation.mark(node)
+        if isinstance(node.value, (dict, list)):
+            # A whole container was set, so what's below it may have changed
+            self.removal.discard(node)
+        self.removal.changed(node)
+        if is_key or isinstance(node.value, (dict, list)):
+            self._leaves = None
+        elif self._leaves is not None:
+            self._leaves[id(node)] = node
+
+    def _request_save(self):
+        if self._batch_depth:
+            self._save_requested = True
+        elif self.saver is None:
+            self.save()
+        else:
+            self.saver.schedule()
+
+    def flush(self):
+        if self.saver is not None:
+            self.saver.flush()
+        self._collect_writes(wait=True)
+        self.backend.sync()
+        if self.publisher is not None:
+            self._publisher_timer.flush()
+
+    async def saved(self):
+        if self.saver is not None:
+            await self.saver.saved()
 
     def on_remove(self, node):
+        path = list(node.key_path)
+        if self._recording():
+            parent = node.parent
+            self._record(
+                (
+                    "insert",
+                    parent.key_path,
+                    parent.children.index(node),
+                    node.key,
+                    node.to_dict(),
+                ),
+                ("remove", node.key_path),
+            )
         super().on_remove(node)
-        self.on_change()
+        self.validation.discard(node)
+        self.validation.mark(node.parent, keys=True)
+        self.removal.removed(node)
+        self._leaves = None
+        if self.journal is not None:
+            self._operations.append({"op": "remove", "path": path})
+        self._request_save()
 
     def on_add(self, node, default_value):
+        if self._recording() and not isinstance(node.value, list):
+            old_value = node.to_dict()
         super().on_add(node, default_value)
-        self.on_change()
+        if isinstance(node.value, list):
+            child = node.children[-1]
+            if self._recording():
+                self._record(
+                    ("remove", child.key_path),
+                    ("insert", node.key_path, child.key, child.key, child.to_dict()),
+                )
+            self._mark_changed(child)
+            operation = {"op": "add", "value": child.to_dict()}
+        else:
+            child = node
+            if self._recording():
+                self._record(
+                    ("set", node.key_path, old_value),
+                    ("set", node.key_path, node.to_dict()),
+                )
+            self._mark_changed(node)
+            # Adding to a dict replaces its value with the default
+            operation = {"op": "replace", "value": node.to_dict()}
+        self._leaves = None
+        if self.journal is not None:
+            operation["path"] = list(child.key_path)
+            self._operations.append(operation)
+        self._request_save()
+
+
+def _replay(journal, data, schema, instruments):
+    # Apply the edits in a journal to the data loaded from its file, and
+    # validate the result. A journal that can't be applied is set aside, so
+    # the file, which is fine on its own, isn't replaced with the example.
+    if not journal.exists():
+        return data, 0
+    try:
+        replayed_data, replayed = journal.replay(_copy_tree(data))
+        if replayed:
+            instruments.count("validations")
+            with instruments.span("validate", full=True):
+                SchemaDataSource.validate_data(replayed_data, schema)
+    except (ValueError, TypeError, LookupError) as e:
+        backup = journal.set_aside()
+        print(f"Could not apply the journal, moved to {backup}: {e}")
+        return data, 0
+    return replayed_data, replayed
+
+
+def _read_yaml(yaml_file, schema, example_yaml, serializer, snapshot, measure=False):
+    # Everything from_yaml does before building nodes. Its arguments and
+    # result can all be pickled, so load() can run it in a process pool; with
+    # measure set, it's timed into a list of events to replay.
+    import os
+    import shutil
+
+    recorder = Recorder()
+    instruments = Instruments(recorder) if measure else Instruments()
+    replayed = 0
+    if snapshot is True:
+        snapshot = Snapshot(yaml_file, schema)
+    if not os.path.exists(yaml_file):
+        if example_yaml is None:
+            raise FileNotFoundError(
+                f"Settings file {yaml_file} not found and no example file provided"
+            )
+
+        if not os.path.exists(example_yaml):
+            raise FileNotFoundError(f"Example file {example_yaml} not found")
+
+        # Validate example file first
+        with open(example_yaml, "rb") as file:
+            example_data = serializer.load(file)
+        SchemaDataSource.validate_data(example_data, schema)
+
+        # Create directory if it doesn't exist
+        os.makedirs(os.path.dirname(yaml_file), exist_ok=True)
+
+        # Copy validated example file
+        shutil.copy2(example_yaml, yaml_file)
+        data = example_data
+        if snapshot:
+            snapshot.store(data)
+    else:
+        try:
+            pending = Journal(yaml_file)
+            with instruments.span("parse") as span:
+                data = snapshot.load() if snapshot else None
+                cached = validated = data is not None
+                if not cached:
+                    with open(yaml_file, "rb") as file:
+                        if measure:
+                            span.set(bytes=os.fstat(file.fileno()).st_size)
+                        if (
+                            hasattr(serializer, "load_validated")
+                            and not pending.exists()
+                        ):
+                            # Validates as it parses, so there's no second pass
+                            try:
+                                data = serializer.load_validated(file, schema)
+                            except SchemaError as e:
+                                raise ValueError(f"Data does not match schema: {e}")
+                            validated = True
+                        else:
+                            data = serializer.load(file)
+                span.set(snapshot=cached, validated=validated)
+            if validated and not cached:
+                instruments.count("validations")
+            data, replayed = _replay(pending, data, schema, instruments)
+            # Validate existing file, unless that's been done already
+            if not validated and not replayed:
+                instruments.count("validations")
+                with instruments.span("validate", full=True):
+                    SchemaDataSource.validate_data(data, schema)
+            if snapshot and not cached and not replayed:
+                snapshot.store(data)
+        except (yaml.YAMLError, ValueError) as e:
+            if example_yaml is None:
+                raise ValueError(
+                    f"Invalid YAML file {yaml_file} and no example file provided: {e}"
+                )
+
+            # Backup the invalid file
+            backup_file = f"{yaml_file}.backup"
+            import shutil
+
+            shutil.copy2(yaml_file, backup_file)
+
+            # Load and validate example file
+            with open(example_yaml, "rb") as file:
+                example_data = serializer.load(file)
+            SchemaDataSource.validate_data(example_data, schema)
+
+            # Copy validated example file
+            shutil.copy2(example_yaml, yaml_file)
+            data = example_data
+            print(
+                f"Invalid YAML file backed up to {backup_file} and replaced with example file"
+            )
+
+    return data, replayed, snapshot or None, recorder.events
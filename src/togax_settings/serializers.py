@@ -0,0 +1,148 @@
+import json
+import mmap
+
+import yaml
+from schema import SchemaError
+
+from .compiled import compile_schema
+from .streaming import StreamingLoader, Unsupported
+
+try:
+    from yaml import CDumper, CSafeDumper, CSafeLoader
+
+    LIBYAML = True
+except ImportError:  # PyYAML built without libyaml
+    CDumper, CSafeDumper, CSafeLoader = yaml.Dumper, yaml.SafeDumper, yaml.SafeLoader
+    LIBYAML = False
+
+
+def _plain(data, key=False):
+    # libyaml's emitter folds long double-quoted scalars and lays out complex
+    # keys differently from PyYAML's, but produces the same bytes for
+    # everything else. Strings that are printable ASCII are never
+    # double-quoted, and keys shorter than PyYAML's 128 character limit (and
+    # not empty) are always simple.
+    if isinstance(data, str):
+        return (
+            data.isascii() and data.isprintable() and (not key or 0 < len(data) < 120)
+        )
+    if isinstance(data, dict):
+        return all(_plain(k, True) and _plain(v) for k, v in data.items())
+    if isinstance(data, (list, tuple)):
+        return all(_plain(item) for item in data)
+    return True
+
+
+class YamlSerializer:
+    """Turns settings data into YAML bytes and back.
+
+    Loading uses libyaml's C parser when PyYAML was built with it. Dumping
+    does too whenever that is certain to give the same bytes as the pure
+    Python dumper (see _plain), so switching doesn't rewrite users' files;
+    otherwise it falls back to ``yaml.dump``/``yaml.safe_dump``. Pass
+    ``libyaml=False`` to always use the pure Python implementation.
+    """
+
+    def __init__(self, libyaml=LIBYAML):
+        self.libyaml = libyaml
+
+    def load(self, stream):
+        """Parse a file object, bytes or str."""
+        return yaml.load(
+            stream, Loader=CSafeLoader if self.libyaml else yaml.SafeLoader
+        )
+
+    def load_validated(self, stream, schema):
+        """Parse a seekable file object and validate it against ``schema``.
+
+        This streams the document (see StreamingLoader), so the whole YAML
+        node graph never has to be held in memory, and falls back to load()
+        and a full validation for documents it can't stream or that fail to
+        validate, so errors are reported exactly as before.
+        """
+        start = stream.tell()
+        loader = CSafeLoader if self.libyaml else yaml.SafeLoader
+        try:
+            return StreamingLoader(stream, schema, loader).load()
+        except (Unsupported, SchemaError):
+            stream.seek(start)
+        data = self.load(stream)
+        compile_schema(schema)(data)
+        return data
+
+    def dump(self, data):
+        """Serialise data the way ``yaml.dump`` does, as UTF-8 bytes."""
+        fast = self.libyaml and isinstance(data, (dict, list)) and _plain(data)
+        return yaml.dump(data, Dumper=CDumper if fast else yaml.Dumper).encode("utf-8")
+
+    def safe_dump(self, data):
+        """Serialise data the way ``yaml.safe_dump`` does, as UTF-8 bytes."""
+        fast = self.libyaml and isinstance(data, (dict, list)) and _plain(data)
+        dumper = CSafeDumper if fast else yaml.SafeDumper
+        return yaml.dump(data, Dumper=dumper).encode("utf-8")
+
+
+class JsonSerializer:
+    """Turns settings data into JSON, using orjson when it's installed.
+
+    JSON object keys are always strings, so non-string keys don't survive a
+    round trip.
+    """
+
+    def __init__(self, indent=2):
+        self.indent = indent
+        try:
+            import orjson
+        except ImportError:
+            orjson = None
+        self._orjson = orjson if indent in (None, 2) else None
+
+    def load(self, stream):
+        if self._orjson is not None and hasattr(stream, "fileno"):
+            # orjson can parse straight out of the page cache, without
+            # reading the file into a bytes object first
+            try:
+                buffer = mmap.mmap(stream.fileno(), 0, access=mmap.ACCESS_READ)
+            except (OSError, ValueError):
+                pass  # Empty files can't be mapped
+            else:
+                with buffer, memoryview(buffer) as view:
+                    return self._orjson.loads(view)
+        if not isinstance(stream, (bytes, str)):
+            stream = stream.read()
+        if self._orjson is not None:
+            return self._orjson.loads(stream)
+        return json.loads(stream)
+
+    def dump(self, data):
+        if self._orjson is not None:
+            option = self._orjson.OPT_NON_STR_KEYS
+            if self.indent:
+                option |= self._orjson.OPT_INDENT_2
+            return self._orjson.dumps(data, option=option)
+        return json.dumps(data, indent=self.indent, ensure_ascii=False).encode("utf-8")
+
+    safe_dump = dump
+
+
+class MsgpackSerializer:
+    """Turns settings data into msgpack. Needs the msgpack package."""
+
+    def __init__(self):
+        import msgpack
+
+        self._msgpack = msgpack
+
+    def load(self, stream):
+        if not isinstance(stream, bytes):
+            stream = stream.read()
+        return self._msgpack.unpackb(stream, raw=False, strict_map_key=False)
+
+    def dump(self, data):
+        return self._msgpack.packb(data, use_bin_type=True)
+
+    safe_dump = dump
+
+
+#: The serializer data sources use unless they're given another one
+default_serializer = YamlSerializer()
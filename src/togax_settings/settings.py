@@ -1,10 +1,9 @@
+import asyncio
+import inspect
 import os
 
 import toga
 
-# Dialogs are now called directly on the window
-from schema import Schema, SchemaError  # , And, Optional
-
 # from schema_source import CustomDataSource
 from toga.constants import COLUMN, ROW
 from toga.platform import get_platform_factory
@@ -12,16 +11,41 @@ from toga.platform import get_platform_factory
 # from toga.sources import Source
 from toga.style import Pack
 
+from .expansion import ExpansionState
+from .instrumentation import Instruments
+
 TOGA_PLATFORM = get_platform_factory().__name__
 
 
 class SchemaNodeWidget(toga.Box):
     def __init__(self, root_node, node, style=Pack(direction=ROW, padding=(0, 5))):
         super().__init__(style=style)
-        self.node = node
+        self.node = None
         self.key_widget = None
         self.value_widget = None
         self.root_node = root_node
+        self._shape = None
+        self._binding = False
+
+        self.bind(node)
+
+    def bind(self, node):
+        """Show ``node`` in this widget.
+
+        If the node needs the same kinds of widgets as the one shown before,
+        they are updated in place rather than rebuilt, which lets a virtual tree
+        recycle rows as it scrolls.
+        """
+        self.node = node
+        shape = self._get_shape()
+        if shape == self._shape:
+            self._update_widgets()
+            return
+
+        self._shape = shape
+        self.clear()
+        self.key_widget = None
+        self.value_widget = None
 
         self._create_key_widget()
 
@@ -31,22 +55,49 @@ class SchemaNodeWidget(toga.Box):
         self._create_remove_button()
         self._create_add_button()
 
+    def _get_shape(self):
+        number_input = None
+        if not isinstance(self.node.value, (dict, list)):
+            number_input = (
+                self._get_value_type() == int
+                and TOGA_PLATFORM != "toga_textual.factory"
+            )
+        add_kind = None
+        if self._can_add():
+            add_kind = dict if isinstance(self.node.value, dict) else list
+        return bool(self.node.keyschema), number_input, self._can_remove(), add_kind
+
+    def _update_widgets(self):
+        # Setting values fires on_change handlers; they mustn't save anything
+        self._binding = True
+        try:
+            if self.node.keyschema:
+                self.key_widget.validators = [self.node.key_validator]
+                self.key_widget.value = self.node.key
+            else:
+                self.key_widget.text = self.node.key
+            if isinstance(self.value_widget, toga.NumberInput):
+                self.value_widget.value = self.node.value
+            elif self.value_widget is not None:
+                self.value_widget.validators = [self.node.validator]
+                self.value_widget.value = str(self.node.value)
+        finally:
+            self._binding = False
+
     def _create_remove_button(self):
-        if self._can_remove():
+        if self._shape[2]:
             remove_button = toga.Button(
                 "X", on_press=self._remove_node, style=Pack(padding_left=5)
             )
             self.add(remove_button)
 
     def _create_add_button(self):
-        if self.node.path not in self.root_node.defaults:
-            return
-        if isinstance(self.node.value, dict):
+        if self._shape[3] is dict:
             add_button = toga.Button(
                 "+", on_press=self._add_default, style=Pack(padding_left=5)
             )
             self.add(add_button)
-        elif isinstance(self.node.value, list):
+        elif self._shape[3] is list:
             add_button = toga.Button(
                 "+", on_press=self._add_default_list, style=Pack(padding_left=5)
             )
@@ -54,25 +105,7 @@ class SchemaNodeWidget(toga.Box):
 
     def _can_remove(self):
         # Check if the node and its children can be removed and still validate
-        if self.node.parent is None:
-            return False
-
-        # If parent is a dict, ensure we're not trying to remove the last required key
-        if isinstance(self.node.parent.value, dict):
-            # Create a temporary dict without this key
-            temp_dict = self.node.parent.to_dict()
-            del temp_dict[self.node.key]
-
-            try:
-                # Validate against parent's schema
-                Schema(self.node.parent.schema).validate(temp_dict)
-                return True
-            except SchemaError:
-                # If validation fails, this key is required
-                return False
-
-        # For non-dict parents (like lists), always allow removal
-        return True
+        return self.root_node.can_remove(self.node)
 
     def _can_add(self):
         return self.node.path in self.root_node.defaults and isinstance(
@@ -135,6 +168,8 @@ class SchemaNodeWidget(toga.Box):
         return type(self.node.value)
 
     def on_value_change(self, widget, is_key):
+        if self._binding:
+            return
         new_value = widget.value
 
         if is_key:
@@ -173,16 +208,17 @@ class SchemaNodeWidget(toga.Box):
         # Update the node's key or value
         if is_key:
             old_key = self.node.key
-            self.node.key = new_value
-            if self.node.parent:
-                self.node.parent.value[new_value] = self.node.parent.value.pop(old_key)
+            self.node.rename(new_value)
         else:
             self.node.value = new_value
             if self.node.parent:
                 self.node.parent.value[self.node.key] = new_value
 
         # Call the on_change function to trigger saving
-        self.root_node.on_change()
+        if is_key:
+            self.root_node.on_change(self.node, is_key=True, old_key=old_key)
+        else:
+            self.root_node.on_change(self.node, old_value=current_value)
 
 
 class SettingsTree(toga.Box):
@@ -192,24 +228,82 @@ class SettingsTree(toga.Box):
         node=None,
         style=Pack(direction=COLUMN, padding=(5, 5, 5, 15)),
         depth=0,
+        expand_depth=None,
+        state_file=None,
+        max_expanded=None,
+        expansion=None,
+        instruments=None,
     ):
         super().__init__(style=style)
+        self.depth = depth
+        self.expander = None
+        # Times building widgets; by default, with the data source's
+        self.instruments = instruments
+
+        # Branches deeper than expand_depth start collapsed, and only build
+        # widgets for their children once expanded. Sub-trees share the
+        # root's expansion state.
+        if expansion is None and (
+            expand_depth is not None
+            or state_file is not None
+            or max_expanded is not None
+        ):
+            expansion = ExpansionState(expand_depth, state_file, max_expanded)
+        self.expansion = expansion
+
+        # root_node can also be something to await for the data source, like
+        # ``SchemaDataSource.load(...)``, in which case a placeholder is shown
+        # until it's ready
+        self.loading = None
+        if inspect.isawaitable(root_node):
+            self.root_node = self.node = None
+            self._show_placeholder()
+            self.loading = asyncio.ensure_future(self._load(root_node))
+            return
+
         self.root_node = root_node
         self.node = node if node is not None else root_node
-        self.depth = depth
+        self._build()
 
-        # Check for backup file only at the root level
-        if depth == 0:
-            import asyncio
+    def _build(self):
+        if self.instruments is None:
+            self.instruments = getattr(self.root_node, "instruments", None)
+            if self.instruments is None:
+                self.instruments = Instruments()
 
+        # Check for backup file only at the root level
+        if self.depth == 0:
             asyncio.create_task(self._check_backup_file())
-
-        self.create_widgets()
+            with self.instruments.span("render") as span:
+                self.create_widgets()
+                if self.instruments.enabled:
+                    span.set(nodes=self._count_trees())
+        else:
+            self.create_widgets()
 
         # Only add reset button at the root level
-        if depth == 0 and hasattr(root_node, "example_yaml"):
+        if self.depth == 0 and hasattr(self.root_node, "example_yaml"):
             self._add_reset_button()
 
+    def _show_placeholder(self):
+        self.spinner = toga.ActivityIndicator(running=True)
+        self.status = toga.Label("Loading settings…", style=Pack(padding_left=5))
+        placeholder = toga.Box(style=Pack(direction=ROW))
+        placeholder.add(self.spinner, self.status)
+        self.add(placeholder)
+
+    async def _load(self, awaitable):
+        try:
+            root_node = await awaitable
+        except Exception as e:
+            self.spinner.stop()
+            self.status.text = f"Could not load settings: {e}"
+            raise
+        self.root_node = self.node = root_node
+        self.clear()
+        self._build()
+        return root_node
+
     async def _check_backup_file(self):
         # Check if a backup file exists for the current settings file
         if hasattr(self.root_node, "yaml_file"):
@@ -278,21 +372,16 @@ class SettingsTree(toga.Box):
             if hasattr(self.root_node, "example_yaml"):
                 try:
                     # Reload the entire data source from the example yaml
-                    import yaml
-
-                    with open(self.root_node.example_yaml) as file:
-                        example_data = yaml.safe_load(file)
+                    example_data = await asyncio.get_running_loop().run_in_executor(
+                        None, self._read_example
+                    )
 
-                    # Update the root node's value and recreate widgets
-                    self.root_node.value = example_data
-                    self.root_node.children.clear()
-                    self.root_node._add_children()
+                    # Update only the settings that differ from the defaults;
+                    # the widgets for them follow the node notifications
+                    self.root_node.replace(example_data)
 
                     # Save the new defaults
-                    self.root_node.save_to_yaml()
-
-                    # Recreate the entire widget tree
-                    self.create_widgets()
+                    await self.root_node.save_to_yaml_async()
 
                     await self.window.dialog(
                         toga.InfoDialog(
@@ -308,6 +397,15 @@ class SettingsTree(toga.Box):
                         )
                     )
 
+    def _read_example(self):
+        with open(self.root_node.example_yaml, "rb") as file:
+            return self.root_node.serializer.load(file)
+
+    def _export(self, data, file_path):
+        data = self.root_node.serializer.safe_dump(data)
+        with open(file_path, "wb") as file:
+            file.write(data)
+
     async def _save_settings(self, widget):
         # Open a save file dialog
         save_dialog = toga.SaveFileDialog(
@@ -318,11 +416,11 @@ class SettingsTree(toga.Box):
 
         if file_path:
             try:
-                # Save the current settings to the selected file
-                import yaml
-
-                with open(file_path, "w") as file:
-                    yaml.safe_dump(self.root_node.to_dict(), file)
+                # Save the current settings to the selected file, serialising
+                # a copy of them off the event loop
+                await asyncio.get_running_loop().run_in_executor(
+                    None, self._export, self.root_node.to_dict(), file_path
+                )
 
                 await self.window.dialog(
                     toga.InfoDialog(
@@ -339,16 +437,109 @@ class SettingsTree(toga.Box):
                 )
 
     def create_widgets(self):
-        self.children.clear()
-        self.add(SchemaNodeWidget(self.root_node, self.node))
+        # Sub-trees from an earlier call stop listening before they're dropped
+        for tree in self.children:
+            if isinstance(tree, SettingsTree):
+                tree.teardown()
+        self.clear()
+        self.node_widget = node_widget = SchemaNodeWidget(self.root_node, self.node)
+        self.instruments.count("widgets_created")
+
+        if self._collapsible():
+            self.expander = toga.Button("", on_press=self._toggle, style=Pack(width=30))
+            header = toga.Box(style=Pack(direction=ROW))
+            header.add(self.expander, node_widget)
+            self.add(header)
+        else:
+            self.add(node_widget)
 
-        if isinstance(self.node.value, (dict, list)):
-            for child in self.node.children:
-                self.add_node(child=child)
+        if self.is_expanded():
+            self._add_child_trees()
+        self._update_expander()
         self.node.add_listener(self)
 
+    def _collapsible(self):
+        return self.expansion is not None and isinstance(self.node.value, (dict, list))
+
+    def is_expanded(self):
+        if not isinstance(self.node.value, (dict, list)):
+            return False
+        if self.expansion is None:
+            return True
+        return self.expansion.is_expanded(self.node.key_path)
+
+    def _update_expander(self):
+        if self.expander is not None:
+            self.expander.text = "▾" if self.is_expanded() else "▸"
+
+    def _toggle(self, widget):
+        if self.is_expanded():
+            self.collapse()
+        else:
+            self.expand()
+
+    def expand(self):
+        self.expansion.set_expanded(self.node.key_path, True)
+        with self.instruments.span("render") as span:
+            self._add_child_trees()
+            if self.instruments.enabled:
+                span.set(nodes=self._count_trees() - 1)
+        self._update_expander()
+
+    def collapse(self):
+        self.expansion.set_expanded(self.node.key_path, False)
+        self._remove_child_trees()
+        self._update_expander()
+
+    def _add_child_trees(self):
+        for child in self.node.children:
+            self.add_node(child=child)
+        if self.expansion is not None:
+            self.expansion.opened(self.node.key_path, self)
+
+    def _remove_child_trees(self):
+        for tree in [w for w in self.children if isinstance(w, SettingsTree)]:
+            tree.teardown()
+            self.remove(tree)
+        if self.expansion is not None:
+            self.expansion.closed(self.node.key_path)
+
+    def _count_trees(self):
+        # How many nodes this tree shows
+        return 1 + sum(
+            tree._count_trees()
+            for tree in self.children
+            if isinstance(tree, SettingsTree)
+        )
+
+    def teardown(self):
+        """Stop listening to the node tree, here and in every sub-tree."""
+        self.node.remove_listener(self)
+        for tree in self.children:
+            if isinstance(tree, SettingsTree):
+                tree.teardown()
+        if self.expansion is not None:
+            self.expansion.closed(self.node.key_path)
+
     def remove_node(self, child=None, **kwargs):
+        self.teardown()
         self.parent.remove(self)
 
-    def add_node(self, key=None, child=None, **kwargs):
-        self.add(SettingsTree(self.root_node, node=child, depth=self.depth + 1))
+    def add_node(self, key=None, child=None, index=None, **kwargs):
+        if not self.is_expanded():
+            return  # Built when the branch is expanded
+        tree = SettingsTree(
+            self.root_node,
+            node=child,
+            depth=self.depth + 1,
+            expansion=self.expansion,
+            instruments=self.instruments,
+        )
+        if index is None:
+            self.add(tree)
+        else:
+            # Sub-trees follow the widget for this node
+            self.insert(index + 1, tree)
+
+    def change_node(self, item=None, **kwargs):
+        self.node_widget.bind(self.node)
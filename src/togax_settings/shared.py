@@ -0,0 +1,392 @@
+import mmap
+import os
+import struct
+import threading
+import time
+
+from .schema_source import _split_path
+
+# The file starts with a header: a magic number, the format, the sequence
+# counter (odd while a snapshot is being written), the version of the
+# snapshot and its size. The snapshot follows.
+MAGIC = b"TGXS"
+FORMAT = 1
+_HEADER = struct.Struct("<4sIQQQ")
+_SEQUENCE = struct.Struct("<Q")
+_SEQUENCE_AT = 8
+_VERSION_SIZE = struct.Struct("<QQ")
+_VERSION_AT = 16
+_BASE = _HEADER.size
+
+_U32 = struct.Struct("<I")
+_I64 = struct.Struct("<q")
+_F64 = struct.Struct("<d")
+_ENTRY = struct.Struct("<III")  # key offset, key length, value offset
+
+_INITIAL_CAPACITY = 64 * 1024
+_MISSING = object()
+
+
+def encode(data):
+    """Return the snapshot of ``data`` that Publisher writes, as bytes.
+
+    Each value is a tag byte and its contents; dicts and lists store the
+    offsets of their items, so any one of them can be found and read
+    without looking at the rest. A dict also stores the order of its
+    encoded keys, to look them up by binary search.
+    """
+    buffer = bytearray()
+    _encode(buffer, data)
+    return bytes(buffer)
+
+
+def _encode(buffer, value):
+    offset = len(buffer)
+    if value is None:
+        buffer += b"N"
+    elif value is True:
+        buffer += b"T"
+    elif value is False:
+        buffer += b"F"
+    elif isinstance(value, int):
+        if -(2**63) <= value < 2**63:
+            buffer += b"i" + _I64.pack(value)
+        else:
+            digits = str(value).encode()
+            buffer += b"I" + _U32.pack(len(digits)) + digits
+    elif isinstance(value, float):
+        buffer += b"f" + _F64.pack(value)
+    elif isinstance(value, str):
+        encoded = value.encode("utf-8", "surrogatepass")
+        buffer += b"s" + _U32.pack(len(encoded)) + encoded
+    elif isinstance(value, bytes):
+        buffer += b"b" + _U32.pack(len(value)) + value
+    elif isinstance(value, dict):
+        count = len(value)
+        buffer += b"d" + _U32.pack(count)
+        table = len(buffer)
+        buffer += bytes((_ENTRY.size + 4) * count)
+        keys = []
+        for index, (key, item) in enumerate(value.items()):
+            key_offset = _encode(buffer, key)
+            key_end = len(buffer)
+            _ENTRY.pack_into(
+                buffer,
+                table + index * _ENTRY.size,
+                key_offset,
+                key_end - key_offset,
+                key_end,
+            )
+            _encode(buffer, item)
+            keys.append(bytes(buffer[key_offset:key_end]))
+        order = sorted(range(count), key=keys.__getitem__)
+        struct.pack_into(f"<{count}I", buffer, table + count * _ENTRY.size, *order)
+    elif isinstance(value, (list, tuple)):
+        count = len(value)
+        buffer += b"l" + _U32.pack(count)
+        table = len(buffer)
+        buffer += bytes(4 * count)
+        for index, item in enumerate(value):
+            _U32.pack_into(buffer, table + 4 * index, len(buffer))
+            _encode(buffer, item)
+    else:
+        raise TypeError(f"Can't publish values of type {type(value).__name__}")
+    return offset
+
+
+def _decode(view, offset):
+    tag = view[offset]
+    if tag == 0x4E:  # N
+        return None
+    if tag == 0x54:  # T
+        return True
+    if tag == 0x46:  # F
+        return False
+    if tag == 0x69:  # i
+        return _I64.unpack_from(view, offset + 1)[0]
+    if tag == 0x66:  # f
+        return _F64.unpack_from(view, offset + 1)[0]
+    if tag in (0x73, 0x62, 0x49):  # s, b, I
+        start, end = _extent(view, offset)
+        if tag == 0x62:
+            return bytes(view[start:end])
+        text = str(view[start:end], "utf-8", "surrogatepass")
+        return text if tag == 0x73 else int(text)
+    count, table = _table(view, offset)
+    if tag == 0x64:  # d
+        result = {}
+        for index in range(count):
+            key_offset, _, value_offset = _ENTRY.unpack_from(
+                view, table + index * _ENTRY.size
+            )
+            result[_decode(view, key_offset)] = _decode(view, value_offset)
+        return result
+    if tag == 0x6C:  # l
+        return [
+            _decode(view, item)
+            for item in struct.unpack_from(f"<{count}I", view, table)
+        ]
+    raise ValueError(f"Unknown tag {tag} at {offset}")
+
+
+def _extent(view, offset):
+    size = _U32.unpack_from(view, offset + 1)[0]
+    start = offset + 5
+    if start + size > len(view):
+        raise ValueError(f"Value at {offset} runs past the end")
+    return start, start + size
+
+
+def _table(view, offset):
+    count = _U32.unpack_from(view, offset + 1)[0]
+    if offset + 5 + count * 4 > len(view):
+        raise ValueError(f"Table at {offset} runs past the end")
+    return count, offset + 5
+
+
+def _child(view, offset, key):
+    # Return the offset of a dict's or list's item, or raise KeyError
+    tag = view[offset]
+    if tag == 0x6C:  # l
+        if isinstance(key, str) and key.isdigit():
+            key = int(key)
+        count, table = _table(view, offset)
+        if type(key) is not int or not 0 <= key < count:
+            raise KeyError(key)
+        return _U32.unpack_from(view, table + 4 * key)[0]
+    if tag != 0x64:  # d
+        raise KeyError(key)
+
+    count, table = _table(view, offset)
+    order = table + count * _ENTRY.size
+    try:
+        target = encode(key)
+    except TypeError:
+        raise KeyError(key)
+    low, high = 0, count
+    while low < high:
+        middle = (low + high) // 2
+        index = _U32.unpack_from(view, order + 4 * middle)[0]
+        key_offset, key_size, value_offset = _ENTRY.unpack_from(
+            view, table + index * _ENTRY.size
+        )
+        key_end = key_offset + key_size
+        found = view[key_offset:key_end]
+        if found == target:
+            return value_offset
+        if found.tobytes() < target:
+            low = middle + 1
+        else:
+            high = middle
+    raise KeyError(key)
+
+
+class Publisher:
+    """Publishes snapshots of settings to a memory-mapped file.
+
+    Other processes read them with SharedSettings, without parsing or
+    validating anything. Each publish() writes the snapshot in place and
+    bumps the version, with a sequence counter around the write (a seqlock)
+    so readers can tell whether what they read was torn by a write and
+    retry. Put the file on a RAM-backed file system like /dev/shm to keep it
+    off the disk. The file only ever grows, and only one Publisher may write
+    to it at a time.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        self._file = os.fdopen(fd, "r+b")
+        size = os.fstat(fd).st_size
+        if 0 < size < _BASE:
+            self._file.close()
+            raise ValueError(f"{path} is not a settings snapshot")
+        if size == 0:
+            size = _INITIAL_CAPACITY
+            os.ftruncate(fd, size)
+        self._map = mmap.mmap(fd, size)
+
+        magic, file_format, sequence, version, _ = _HEADER.unpack_from(self._map)
+        if magic != MAGIC and any(self._map[:_BASE]):
+            self.close()
+            raise ValueError(f"{path} is not a settings snapshot")
+        if file_format != FORMAT:
+            sequence = version = 0
+        # Carry on from a previous run, so readers never see a version twice;
+        # an odd sequence means it stopped half way through a write.
+        self._sequence = sequence + (sequence & 1)
+        self.version = version
+
+    def publish(self, data):
+        """Publish ``data``, returning the size of the snapshot in bytes.
+
+        Returns None if the data can't be published, after printing why.
+        Publishing the same data as last time doesn't change the version.
+        """
+        try:
+            snapshot = encode(data)
+        except (TypeError, RecursionError) as e:
+            print(f"Could not publish settings: {e}")
+            return None
+        size = len(snapshot)
+        with self._lock:
+            if self.version and self._current() == snapshot:
+                return size
+            try:
+                if _BASE + size > len(self._map):
+                    self._grow(_BASE + size)
+            except OSError as e:
+                print(f"Could not publish settings: {e}")
+                return None
+
+            end = _BASE + size
+            self._write_sequence(self._sequence + 1)
+            self._map[_BASE:end] = snapshot
+            self.version += 1
+            _HEADER.pack_into(
+                self._map, 0, MAGIC, FORMAT, self._sequence, self.version, size
+            )
+            self._write_sequence(self._sequence + 1)
+        return size
+
+    def _current(self):
+        end = _BASE + _VERSION_SIZE.unpack_from(self._map, _VERSION_AT)[1]
+        return self._map[_BASE:end]
+
+    def _write_sequence(self, sequence):
+        self._sequence = sequence
+        _SEQUENCE.pack_into(self._map, _SEQUENCE_AT, sequence)
+
+    def _grow(self, needed):
+        capacity = len(self._map)
+        while capacity < needed:
+            capacity *= 2
+        fd = self._file.fileno()
+        os.ftruncate(fd, capacity)
+        self._map.close()
+        self._map = mmap.mmap(fd, capacity)
+
+    def close(self):
+        self._map.close()
+        self._file.close()
+
+
+class SharedSettings:
+    """Reads the settings a Publisher publishes, from any process.
+
+    get() finds a value by following the offsets in the shared snapshot, so
+    only the value asked for is ever decoded, and takes time proportional to
+    the length of the path (and the log of the sizes of the dicts on the
+    way), not the size of the settings. Each call reads one consistent
+    version; read a common parent to get several values from the same one.
+    Checking ``version``, or changed(), is a single read from the mapping.
+    A read that keeps clashing with writes for longer than ``timeout``
+    seconds raises TimeoutError.
+    """
+
+    def __init__(self, path, timeout=1.0):
+        self.path = path
+        self.timeout = timeout
+        self._file = open(path, "rb")
+        self._map = None
+        self._view = None
+        self._seen = None
+        self._remap()
+
+    def _remap(self):
+        self._release()
+        size = os.fstat(self._file.fileno()).st_size
+        if size < _BASE:
+            return  # Nothing published yet
+        self._map = mmap.mmap(self._file.fileno(), size, access=mmap.ACCESS_READ)
+        self._view = memoryview(self._map)
+        magic, file_format = _HEADER.unpack_from(self._view)[:2]
+        if magic != MAGIC and any(self._view[:_BASE]):
+            self._release()
+            raise ValueError(f"{self.path} is not a settings snapshot")
+        if file_format not in (0, FORMAT):
+            self._release()
+            raise ValueError(f"{self.path} has snapshot format {file_format}")
+
+    def _release(self):
+        if self._view is not None:
+            try:
+                self._view.release()
+                self._map.close()
+            except BufferError:
+                pass  # Still in use (by a traceback, say); closed once it's not
+        self._map = self._view = None
+
+    @property
+    def version(self):
+        """The version of the latest snapshot, 0 if none has been published."""
+        if self._view is None:
+            self._remap()
+            if self._view is None:
+                return 0
+        return _VERSION_SIZE.unpack_from(self._view, _VERSION_AT)[0]
+
+    def changed(self):
+        """Has a new version been published since changed() last returned?"""
+        version = self.version
+        changed = version != self._seen
+        self._seen = version
+        return changed
+
+    def get(self, path=(), default=_MISSING):
+        """Return a copy of the value at ``path``, which is a sequence of keys
+        and list indices or a string of them joined by dots, as for
+        SchemaDataSource.find. Raises KeyError if there's no such value, or
+        returns ``default`` if given."""
+        keys = _split_path(path)
+        try:
+            return self._read(lambda view: _decode(view, self._find(view, keys)))
+        except KeyError:
+            if default is _MISSING:
+                raise
+            return default
+
+    def _find(self, view, keys):
+        offset = 0
+        for key in keys:
+            offset = _child(view, offset, key)
+        return offset
+
+    def _read(self, function):
+        # Run function on the snapshot until a run isn't overlapped by a write
+        deadline = None
+        while True:
+            if self.version == 0:
+                raise KeyError("Nothing has been published yet")
+            view = self._view
+            sequence = _SEQUENCE.unpack_from(view, _SEQUENCE_AT)[0]
+            if not sequence & 1:
+                end = _BASE + _VERSION_SIZE.unpack_from(view, _VERSION_AT)[1]
+                if end > len(view):
+                    self._remap()  # The file has grown
+                    continue
+                try:
+                    result = function(view[_BASE:end])
+                except Exception:
+                    if _SEQUENCE.unpack_from(view, _SEQUENCE_AT)[0] == sequence:
+                        raise
+                else:
+                    if _SEQUENCE.unpack_from(view, _SEQUENCE_AT)[0] == sequence:
+                        return result
+
+            if deadline is None:
+                deadline = time.monotonic() + self.timeout
+            elif time.monotonic() > deadline:
+                raise TimeoutError(f"Settings in {self.path} kept changing")
+            time.sleep(0)
+
+    def close(self):
+        self._release()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
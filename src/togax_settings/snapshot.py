@@ -0,0 +1,126 @@
+import hashlib
+import os
+import pickle
+import re
+import types
+
+from .saver import AtomicWriter, file_digest
+
+# Bump whenever the layout of snapshot files changes
+FORMAT = 1
+
+# Validation state rather than part of what a schema accepts
+_TRANSIENT = {"match_count"}
+
+
+def _describe(obj, seen):
+    # A structure that only depends on what obj is, not where it lives in
+    # memory, so fingerprints are stable from one run to the next.
+    if obj is None or isinstance(obj, (bool, int, float, str, bytes)):
+        return repr(obj)
+    if isinstance(obj, type):
+        return ("type", obj.__module__, obj.__qualname__)
+    if id(obj) in seen:
+        return "cycle"
+    seen = seen | {id(obj)}
+
+    if isinstance(obj, dict):
+        return (
+            "dict",
+            [(_describe(k, seen), _describe(v, seen)) for k, v in obj.items()],
+        )
+    if isinstance(obj, (list, tuple)):
+        return (type(obj).__name__, [_describe(item, seen) for item in obj])
+    if isinstance(obj, (set, frozenset)):
+        return ("set", sorted(repr(_describe(item, seen)) for item in obj))
+    if isinstance(obj, types.ModuleType):
+        return ("module", obj.__name__)
+    if isinstance(obj, re.Pattern):
+        return ("pattern", obj.pattern, obj.flags)
+    if isinstance(obj, types.FunctionType):
+        cells = [cell.cell_contents for cell in obj.__closure__ or ()]
+        return (
+            "function",
+            obj.__module__,
+            obj.__qualname__,
+            _describe(obj.__code__, seen),
+            _describe(obj.__defaults__, seen),
+            _describe(cells, seen),
+        )
+    if isinstance(obj, types.CodeType):
+        return (
+            "code",
+            obj.co_code,
+            obj.co_names,
+            [_describe(const, seen) for const in obj.co_consts],
+        )
+    if isinstance(obj, (types.BuiltinFunctionType, types.MethodType)):
+        return ("callable", getattr(obj, "__module__", None), obj.__qualname__)
+    if hasattr(obj, "__dict__"):
+        attributes = sorted(
+            (name, _describe(value, seen))
+            for name, value in vars(obj).items()
+            if name not in _TRANSIENT
+        )
+        return (type(obj).__module__, type(obj).__qualname__, attributes)
+    # Last resort; if this includes an address the snapshot is never reused,
+    # which is slow but safe.
+    return repr(obj)
+
+
+def schema_fingerprint(schema):
+    """Return a digest identifying what ``schema`` accepts, stable across runs."""
+    return hashlib.sha256(repr(_describe(schema, frozenset())).encode()).hexdigest()
+
+
+class Snapshot:
+    """A pickled copy of a settings file's validated contents.
+
+    The snapshot is stored next to the settings file and records the file's
+    size, modification time and content digest, and a fingerprint of the
+    schema it was validated against. load() only returns the data while all
+    of those still match, in which case both parsing and validating the file
+    can be skipped. Snapshots are read with pickle, so they must be kept
+    somewhere only the user can write to, like the settings file itself.
+    """
+
+    def __init__(self, settings_file, schema, path=None):
+        self.settings_file = settings_file
+        self.path = path or f"{settings_file}.snapshot"
+        self.fingerprint = schema_fingerprint(schema)
+        # It's only a cache, so it doesn't need to survive power loss
+        self.writer = AtomicWriter(self.path, fsync_interval=None)
+
+    def _key(self):
+        stat = os.stat(self.settings_file)
+        return (
+            FORMAT,
+            stat.st_size,
+            stat.st_mtime_ns,
+            file_digest(self.settings_file).hex(),
+            self.fingerprint,
+        )
+
+    def load(self):
+        """Return the cached data, or None if there's no valid snapshot."""
+        try:
+            with open(self.path, "rb") as file:
+                if pickle.load(file) != self._key():
+                    return None
+                return pickle.load(file)
+        except (OSError, EOFError, pickle.UnpicklingError, ValueError):
+            return None
+
+    def store(self, data):
+        """Cache ``data``, which must match the settings file as it is now."""
+        try:
+            key = pickle.dumps(self._key(), pickle.HIGHEST_PROTOCOL)
+            self.writer.write(key + pickle.dumps(data, pickle.HIGHEST_PROTOCOL))
+        except (OSError, pickle.PicklingError, TypeError, AttributeError) as e:
+            print(f"Could not save settings snapshot: {e}")
+
+    def clear(self):
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
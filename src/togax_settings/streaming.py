@@ -0,0 +1,186 @@
+import yaml
+from yaml.events import (
+    AliasEvent,
+    MappingEndEvent,
+    MappingStartEvent,
+    ScalarEvent,
+    SequenceEndEvent,
+    SequenceStartEvent,
+    StreamEndEvent,
+    StreamStartEvent,
+)
+from yaml.nodes import ScalarNode
+
+from .compiled import compile_schema
+from .validation import _check_required, _is_structural, match_key
+
+_MAP_TAG = "tag:yaml.org,2002:map"
+_SEQ_TAG = "tag:yaml.org,2002:seq"
+
+# How a value is checked once it is complete: its children have been checked
+# one by one, so only a dict's keys are left; it is checked in full; or it's
+# inside something that will be checked in full, so nothing needs doing.
+_PARTS, _WHOLE, _NONE = range(3)
+
+
+class Unsupported(Exception):
+    """The document uses YAML features the streaming loader doesn't handle."""
+
+
+class _Frame:
+    __slots__ = ("value", "schema", "check", "key", "has_key", "matched")
+
+    def __init__(self, value, schema, check):
+        self.value = value
+        self.schema = schema
+        self.check = check
+        self.key = None
+        self.has_key = False
+        # The ids of the schema keys a checked dict's keys have matched
+        self.matched = set() if check == _PARTS and type(value) is dict else None
+
+
+class StreamingLoader:
+    """Build settings data straight from YAML parser events.
+
+    ``yaml.safe_load`` composes a graph of YAML nodes for the whole document
+    before constructing any Python objects, which takes several times the
+    memory of the data itself. This constructs the data as the events come
+    in, and validates each value against ``schema`` as soon as it is
+    complete: a dict or list whose schema can be checked one level at a time
+    (see is_structural) has its items checked as they arrive and then only
+    its keys, and anything else is checked in full when it ends. The result
+    is the same as loading the document and then validating all of it.
+
+    Documents with explicit collection tags, merge keys or complex keys raise
+    Unsupported, and should be loaded the usual way instead.
+    """
+
+    def __init__(self, stream, schema=None, Loader=yaml.SafeLoader):
+        self.loader = Loader(stream)
+        self.schema = schema
+        self.anchors = {}
+        self._constructors = self.loader.yaml_constructors
+
+    def load(self):
+        try:
+            return self._load()
+        finally:
+            self.loader.dispose()
+
+    def _next(self):
+        return self.loader.get_event()
+
+    def _load(self):
+        loader = self.loader
+        event = self._next()
+        assert isinstance(event, StreamStartEvent)
+        if loader.check_event(StreamEndEvent):
+            return None  # An empty stream
+        self._next()  # DocumentStartEvent
+
+        data = self._document()
+
+        self._next()  # DocumentEndEvent
+        if not loader.check_event(StreamEndEvent):
+            raise Unsupported("More than one document")
+        return data
+
+    def _child(self, frame, event):
+        # Return (schema, check) for the value that starts with event
+        if frame is None:
+            schema = self.schema
+            if schema is None:
+                return None, _NONE
+        elif frame.check != _PARTS:
+            return None, _NONE
+        elif type(frame.value) is list:
+            schema = frame.schema[0]
+        else:
+            skey = match_key(frame.schema, frame.key)
+            frame.matched.add(id(skey))
+            schema = frame.schema[skey]
+
+        if isinstance(event, MappingStartEvent) and type(schema) is dict:
+            structural = _is_structural(schema)
+        elif isinstance(event, SequenceStartEvent) and type(schema) is list:
+            structural = _is_structural(schema)
+        else:
+            structural = False
+        return schema, _PARTS if structural else _WHOLE
+
+    def _document(self):
+        stack = []
+        while True:
+            event = self._next()
+            frame = stack[-1] if stack else None
+            is_key = (
+                frame is not None and type(frame.value) is dict and not frame.has_key
+            )
+
+            if isinstance(event, (MappingEndEvent, SequenceEndEvent)):
+                stack.pop()
+                value = frame.value
+                if frame.check == _PARTS:
+                    if type(value) is dict:
+                        _check_required(frame.schema, frame.matched)
+                elif frame.check == _WHOLE:
+                    compile_schema(frame.schema)(value)
+            elif is_key:
+                if not isinstance(event, ScalarEvent):
+                    raise Unsupported("Only scalar keys are supported")
+                key = self._scalar(event)
+                try:
+                    hash(key)
+                except TypeError:
+                    raise Unsupported("Unhashable key")
+                frame.key = key
+                frame.has_key = True
+                continue
+            elif isinstance(event, (MappingStartEvent, SequenceStartEvent)):
+                mapping = isinstance(event, MappingStartEvent)
+                tag = event.tag
+                if (
+                    tag is not None
+                    and tag != "!"
+                    and tag != (_MAP_TAG if mapping else _SEQ_TAG)
+                ):
+                    raise Unsupported(f"Tag {tag}")
+                schema, check = self._child(frame, event)
+                value = {} if mapping else []
+                if event.anchor is not None:
+                    self.anchors[event.anchor] = value
+                stack.append(_Frame(value, schema, check))
+                continue
+            else:
+                schema, check = self._child(frame, event)
+                if isinstance(event, AliasEvent):
+                    value = self.anchors[event.anchor]
+                else:
+                    value = self._scalar(event)
+                    if event.anchor is not None:
+                        self.anchors[event.anchor] = value
+                if check != _NONE:
+                    compile_schema(schema)(value)
+
+            # A value is complete; add it to its parent
+            if not stack:
+                return value
+            parent = stack[-1]
+            if type(parent.value) is list:
+                parent.value.append(value)
+            else:
+                parent.value[parent.key] = value
+                parent.has_key = False
+
+    def _scalar(self, event):
+        tag = event.tag
+        if tag is None or tag == "!":
+            tag = self.loader.resolve(ScalarNode, event.value, event.implicit)
+        constructor = self._constructors.get(tag)
+        if constructor is None:
+            raise Unsupported(f"Tag {tag}")
+        node = ScalarNode(
+            tag, event.value, event.start_mark, event.end_mark, event.style
+        )
+        return constructor(self.loader, node)
@@ -0,0 +1,321 @@
+from collections import Counter
+
+from schema import (
+    COMPARABLE,
+    Hook,
+    Literal,
+    Optional,
+    Or,
+    Schema,
+    SchemaError,
+    SchemaMissingKeyError,
+    SchemaWrongKeyError,
+    _priority as schema_priority,
+)
+
+from .compiled import IdentityCache, compile_schema
+
+
+def is_structural(schema):
+    """Can a schema be validated one level at a time?
+
+    Plain dicts can be split into a key-set check plus one check per value, and
+    single-item lists into one check per item. Anything else (``And``, ``Or``,
+    ``Schema`` wrappers, callables, multi-option lists, dicts with hooks or
+    stateful keys) has to see the whole value at once.
+    """
+    if type(schema) is dict:
+        for key in schema:
+            if isinstance(key, Hook) or (isinstance(key, Or) and key.only_one):
+                return False
+        return True
+    return type(schema) is list and len(schema) == 1
+
+
+def _sort_keys(schema):
+    # The order in which schema.Schema tries dict keys
+    return [
+        (skey, compile_schema(skey))
+        for skey in sorted(schema, key=Schema._dict_key_priority)
+    ]
+
+
+def _index_keys(schema):
+    # Literal keys (plain or Optional) are tried before any other kind, and
+    # only match keys equal to them, so they can be looked up in a dict; the
+    # rest are tried in order. Hooks are tried before literals and Literal
+    # wrappers aren't plain values, so schemas with those go the slow way.
+    literals = {}
+    rest = []
+    for skey, validate in _sorted_keys(schema):
+        value = skey._schema if type(skey) is Optional else skey
+        if isinstance(value, (Hook, Literal)):
+            return None, _sorted_keys(schema)
+        if schema_priority(value) == COMPARABLE:
+            literals.setdefault(value, skey)
+        else:
+            rest.append((skey, validate))
+    return literals, rest
+
+
+_sorted_keys = IdentityCache(_sort_keys)
+_indexed_keys = IdentityCache(_index_keys)
+_is_structural = IdentityCache(is_structural)
+
+
+def match_key(schema, key):
+    """Return the schema key that ``schema.Schema`` would match ``key`` with."""
+    literals, rest = _indexed_keys(schema)
+    if literals:
+        try:
+            return literals[key]
+        except (KeyError, TypeError):
+            pass
+    for skey, validate in rest:
+        try:
+            validate(key)
+            return skey
+        except SchemaError:
+            pass
+    raise SchemaWrongKeyError(f"Wrong key {key!r}")
+
+
+def _check_keys(schema, keys):
+    # Check a dict's keys the way schema.Schema does, without its values:
+    # each has to match a schema key, and every required key has to be
+    # matched by one of them
+    matched = {id(match_key(schema, key)) for key in keys}
+    _check_required(schema, matched)
+
+
+def _check_required(schema, matched):
+    # matched holds the ids of the schema keys matched by a dict's keys
+    required = _required_keys(schema)
+    if required.keys() <= matched:
+        return
+    missing = [
+        skey for skey in schema if id(skey) in required and id(skey) not in matched
+    ]
+    raise SchemaMissingKeyError(
+        f"Missing key{'s' if len(missing) > 1 else ''}: "
+        + ", ".join(repr(key) for key in sorted(missing, key=repr))
+    )
+
+
+def _built_subtree(node):
+    # The node and every node below it that has been built, without building
+    # the children of lazy nodes
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        yield node
+        if node._children:
+            stack.extend(node._children)
+
+
+class IncrementalValidator:
+    """Revalidate only the parts of a node tree touched since the last save.
+
+    A changed value needs its own subtree checked, and a changed key set needs
+    its dict's keys checked. Ancestors only have to be looked at when their
+    schema can't be split up (see is_structural), in which case the highest
+    such ancestor is validated in full. Anything else falls back to validating
+    the whole document, as does setting ``incremental`` to False.
+    """
+
+    def __init__(self, root, incremental=True):
+        self.root = root
+        self.incremental = incremental
+        self._full = True
+        self._changes = {}
+
+    @property
+    def full(self):
+        """Will the next validate() check the whole document?"""
+        return self._full or not self.incremental
+
+    @property
+    def pending(self):
+        """The number of changes the next validate() will check."""
+        return len(self._changes)
+
+    def mark_all(self):
+        self._full = True
+        self._changes.clear()
+
+    def mark(self, node, keys=False):
+        if node is None or not self.incremental:
+            self.mark_all()
+        elif not self._full:
+            # A value change rechecks the whole subtree, keys included
+            _, keys_only = self._changes.get(id(node), (node, True))
+            self._changes[id(node)] = (node, keys and keys_only)
+
+    def discard(self, node):
+        """Forget changes inside a subtree that has been removed."""
+        for descendant in _built_subtree(node):
+            self._changes.pop(id(descendant), None)
+
+    def clear(self):
+        self._full = False
+        self._changes.clear()
+
+    def checkpoint(self):
+        """Return the changes marked so far, to restore() later."""
+        return self._full, dict(self._changes)
+
+    def restore(self, checkpoint):
+        full, changes = checkpoint
+        self._full = full
+        self._changes = dict(changes)
+
+    def validate(self, data=None):
+        if self.full:
+            if data is None:
+                data = self.root.to_dict()
+            compile_schema(self.root.schema)(data)
+        else:
+            for node, keys in list(self._changes.values()):
+                self._validate_change(node, keys)
+                del self._changes[id(node)]
+        self.clear()
+
+    def _validate_change(self, node, keys):
+        chain = []
+        while node is not None:
+            chain.append(node)
+            node = node.parent
+        chain.reverse()
+
+        schema = self.root.schema
+        for parent, child in zip(chain, chain[1:]):
+            if not _is_structural(schema):
+                # Nothing below this point can be checked in isolation
+                compile_schema(schema)(parent.to_dict())
+                return
+            if type(schema) is list:
+                schema = schema[0]
+            else:
+                try:
+                    schema = schema[match_key(schema, child.key)]
+                except SchemaWrongKeyError:
+                    _check_keys(schema, [c.key for c in parent.children])
+                    raise
+
+        node = chain[-1]
+        if keys and type(schema) is dict and _is_structural(schema):
+            _check_keys(schema, [child.key for child in node.children])
+        elif keys and type(schema) is list and _is_structural(schema):
+            pass  # Adding or removing items can't invalidate a plain list
+        else:
+            compile_schema(schema)(node.to_dict())
+
+
+def _find_required_keys(schema):
+    # Maps id(schema key) of each key that has to be present to whether it is
+    # a literal, i.e. can only ever be matched by a single data key.
+    return {
+        id(skey): schema_priority(skey) == COMPARABLE
+        for skey in schema
+        if not isinstance(skey, (Optional, Hook))
+    }
+
+
+_required_keys = IdentityCache(_find_required_keys)
+
+
+class RemovalChecker:
+    """Decide whether a node can be removed without invalidating its parent.
+
+    For plain dict schemas this is worked out from the schema key the node
+    matches: ``Optional`` keys can always go, required literal keys never can,
+    and a required pattern (such as ``str``) can as long as another sibling
+    matches it too. Those sibling counts, and the result of removing the key
+    and validating the parent for schemas that can't be analysed this way,
+    are remembered per parent until something below it changes.
+    """
+
+    def __init__(self):
+        self._coverage = {}
+        self._trials = {}
+
+    def can_remove(self, node):
+        parent = node.parent
+        if parent is None:
+            return False
+        if not isinstance(parent.value, dict):
+            return True  # List items can always go
+
+        schema = parent.schema
+        if type(schema) is dict and _is_structural(schema):
+            try:
+                skey = match_key(schema, node.key)
+            except SchemaWrongKeyError:
+                return self._trial(parent, node.key)
+            literal = _required_keys(schema).get(id(skey))
+            if literal is None:
+                return True
+            if literal:
+                return False
+            return self._count(parent, skey) > 1
+        return self._trial(parent, node.key)
+
+    def _count(self, parent, skey):
+        entry = self._coverage.get(id(parent))
+        if entry is None or entry[0] is not parent:
+            schema = parent.schema
+            counts = Counter()
+            for child in parent.children:
+                try:
+                    counts[id(match_key(schema, child.key))] += 1
+                except SchemaWrongKeyError:
+                    pass
+            entry = self._coverage[id(parent)] = (parent, counts)
+        return entry[1][id(skey)]
+
+    def _trial(self, parent, key):
+        entry = self._trials.get(id(parent))
+        if entry is None or entry[0] is not parent:
+            entry = self._trials[id(parent)] = (parent, {})
+        results = entry[1]
+        if key not in results:
+            data = parent.to_dict()
+            del data[key]
+            try:
+                compile_schema(parent.schema)(data)
+                results[key] = True
+            except SchemaError:
+                results[key] = False
+        return results[key]
+
+    def changed(self, node):
+        """Forget what depended on ``node``: its key set and its ancestors' data."""
+        self._coverage.pop(id(node), None)
+        while node is not None:
+            self._trials.pop(id(node), None)
+            node = node.parent
+
+    def discard(self, node):
+        """Forget results for nodes inside a subtree that has been removed."""
+        for descendant in _built_subtree(node):
+            self._coverage.pop(id(descendant), None)
+            self._trials.pop(id(descendant), None)
+
+    def removed(self, node):
+        """Update for ``node`` having been removed from its parent."""
+        self.discard(node)
+        parent = node.parent
+        entry = self._coverage.get(id(parent))
+        if entry is not None and entry[0] is parent:
+            # One fewer sibling matches the node's schema key
+            try:
+                entry[1][id(match_key(parent.schema, node.key))] -= 1
+            except SchemaWrongKeyError:
+                pass
+        while parent is not None:
+            self._trials.pop(id(parent), None)
+            parent = parent.parent
+
+    def clear(self):
+        self._coverage.clear()
+        self._trials.clear()
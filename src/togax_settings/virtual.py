@@ -0,0 +1,202 @@
+import toga
+from toga.constants import COLUMN, ROW
+from toga.style import Pack
+
+from .expansion import ExpansionState
+from .settings import SchemaNodeWidget, SettingsTree
+
+
+class VirtualRow(toga.Box):
+    """A row of a VirtualSettingsTree, rebound to other nodes as it scrolls."""
+
+    def __init__(self, tree):
+        super().__init__(style=Pack(direction=ROW, height=tree.row_height))
+        self.tree = tree
+        self.node = None
+        self.node_widget = None
+        self.expander = toga.Button("", on_press=self._toggle, style=Pack(width=30))
+        self.add(self.expander)
+
+    def bind(self, node, depth):
+        if node is not self.node:
+            self.unbind()
+            node.add_listener(self)
+            self.node = node
+
+        self.style.padding_left = depth * self.tree.indent
+        if isinstance(node.value, (dict, list)):
+            expanded = self.tree.expansion.is_expanded(node.key_path)
+            self.expander.text = "▾" if expanded else "▸"
+            self.expander.enabled = True
+        else:
+            self.expander.text = ""
+            self.expander.enabled = False
+
+        if self.node_widget is None:
+            self.node_widget = SchemaNodeWidget(
+                self.tree.root_node, node, style=Pack(direction=ROW, flex=1)
+            )
+            self.tree.instruments.count("widgets_created")
+            self.add(self.node_widget)
+        else:
+            self.node_widget.bind(node)
+
+    def unbind(self):
+        if self.node is not None:
+            self.node.remove_listener(self)
+            self.node = None
+
+    def _toggle(self, widget):
+        self.tree.toggle(self.node)
+
+    def change_node(self, item=None, **kwargs):
+        self.node_widget.bind(self.node)
+
+
+class VirtualSettingsTree(SettingsTree):
+    """A SettingsTree that only creates widgets for the rows it shows.
+
+    The tree is flattened into one row per node in an expanded branch, and
+    only a window of ``page_size`` rows gets widgets; fixed height spacers
+    above and below stand in for the rest. Branches below ``expand_depth``
+    start collapsed (by default, everything but the root), and expanded
+    paths are kept in ``state_file`` if one is given. Pass the ScrollContainer
+    holding the tree as ``scroll_container`` and the window follows the scroll
+    position, with row widgets rebound to new nodes rather than rebuilt.
+    The tree listens to every node it has a row for, shown or not, so nodes
+    added or removed anywhere in an expanded branch update the rows.
+    """
+
+    def __init__(
+        self,
+        root_node,
+        scroll_container=None,
+        row_height=40,
+        page_size=100,
+        indent=15,
+        expand_depth=1,
+        state_file=None,
+        style=Pack(direction=COLUMN, padding=(5, 5, 5, 15)),
+        instruments=None,
+    ):
+        self.row_height = row_height
+        self.page_size = page_size
+        self.indent = indent
+        self._rows = []
+        self._listened = {}  # id -> node, for the nodes in _rows
+        self._pool = []
+        self._start = 0
+        self._rows_box = None
+
+        super().__init__(
+            root_node,
+            style=style,
+            expansion=ExpansionState(expand_depth, state_file),
+            instruments=instruments,
+        )
+
+        self.scroll_container = scroll_container
+        if scroll_container is not None:
+            scroll_container.on_scroll = self._on_scroll
+
+    def create_widgets(self):
+        if self._rows_box is None:
+            self._top = toga.Box(style=Pack(height=0))
+            self._rows_box = toga.Box(style=Pack(direction=COLUMN))
+            self._bottom = toga.Box(style=Pack(height=0))
+            self.add(self._top, self._rows_box, self._bottom)
+        self.refresh_rows()
+
+    def toggle(self, node):
+        path = node.key_path
+        self.expansion.set_expanded(path, not self.expansion.is_expanded(path))
+        with self.instruments.span("render") as span:
+            self.refresh_rows()
+            span.set(nodes=len(self._pool))
+
+    def _flatten(self):
+        rows = []
+        is_expanded = self.expansion.is_expanded
+        stack = [(self.node, 0, self.node.key_path)]
+        while stack:
+            node, depth, path = stack.pop()
+            rows.append((node, depth))
+            if isinstance(node.value, (dict, list)) and is_expanded(path):
+                stack.extend(
+                    (child, depth + 1, path + (child.key,))
+                    for child in reversed(node.children)
+                )
+        return rows
+
+    def refresh_rows(self):
+        """Recompute the visible rows after nodes or expansions changed."""
+        self._rows = self._flatten()
+        self._listen(node for node, _ in self._rows)
+        self._render(self._start)
+
+    def _listen(self, nodes):
+        listened = {id(node): node for node in nodes}
+        for key, node in self._listened.items():
+            if key not in listened:
+                node.remove_listener(self)
+        for key, node in listened.items():
+            if key not in self._listened:
+                node.add_listener(self)
+        self._listened = listened
+
+    def _render(self, start):
+        start = max(0, min(start, len(self._rows) - self.page_size))
+        end = start + self.page_size
+        window = self._rows[start:end]
+        self._start = start
+
+        # Every change to a widget in a window triggers a relayout of the whole
+        # window, so rebind the rows while they're detached and put them back
+        # in one go.
+        self.remove(self._rows_box)
+        try:
+            while len(self._pool) < len(window):
+                row = VirtualRow(self)
+                self._pool.append(row)
+                self._rows_box.add(row)
+            while len(self._pool) > len(window):
+                row = self._pool.pop()
+                row.unbind()
+                self._rows_box.remove(row)
+
+            for row, (node, depth) in zip(self._pool, window):
+                row.bind(node, depth)
+        finally:
+            self.insert(1, self._rows_box)
+
+        self._top.style.height = start * self.row_height
+        self._bottom.style.height = (
+            len(self._rows) - start - len(window)
+        ) * self.row_height
+
+    def _on_scroll(self, widget, **kwargs):
+        first = int(widget.vertical_position // self.row_height)
+        # Re-window once the top visible row leaves the first half of the page,
+        # keeping a quarter page of rows rendered above it.
+        if not self._start <= first <= self._start + self.page_size // 2:
+            with self.instruments.span("render") as span:
+                self._render(first - self.page_size // 4)
+                span.set(nodes=len(self._pool))
+
+    def _count_trees(self):
+        return len(self._pool)
+
+    def teardown(self):
+        self._listen(())
+        for row in self._pool:
+            row.unbind()
+        super().teardown()
+
+    def add_node(self, **kwargs):
+        self.refresh_rows()
+
+    def remove_node(self, **kwargs):
+        self.refresh_rows()
+
+    def change_node(self, item=None, **kwargs):
+        pass  # Rows rebind the nodes they show
@@ -0,0 +1,98 @@
+import asyncio
+import io
+import os
+
+import yaml
+from schema import SchemaError
+
+from .backends import FileBackend
+from .saver import content_digest
+
+
+class FileWatcher:
+    """Reload a data source when another program changes its settings file.
+
+    The file's size, modification time and inode are polled every
+    ``interval`` seconds, which costs one stat() call. Only when they change
+    is the file read, on a worker thread, and only if its contents differ
+    from what the data source last wrote are they parsed, validated and
+    merged into the node tree with SchemaDataSource.reload(), so widgets
+    for unchanged settings are left alone. Contents that don't parse or
+    validate, like a file an editor is halfway through writing, are ignored
+    until the file changes again.
+    """
+
+    def __init__(self, source, interval=1.0):
+        if not isinstance(source.backend, FileBackend):
+            raise ValueError("Watching needs a file backend")
+        self.source = source
+        self.interval = interval
+        self._stat = self._stat_file()
+        self._task = None
+
+    def _stat_file(self):
+        try:
+            stat = os.stat(self.source.backend.path)
+        except OSError:
+            return None
+        return stat.st_size, stat.st_mtime_ns, stat.st_ino
+
+    def start(self):
+        """Start polling on the running event loop; returns the watcher."""
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+        return self
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            await self.check()
+
+    async def check(self):
+        """Reload the settings if the file has changed since the last check.
+
+        Returns the number of notifications sent (see reconcile).
+        """
+        if any(not write.done() for write in self.source._writes):
+            return 0  # Look again once the data source's own writes are done
+        stat = self._stat_file()
+        if stat is None or stat == self._stat:
+            return 0
+        self._stat = stat
+        result = await asyncio.get_running_loop().run_in_executor(None, self._read)
+        if result is None:
+            return 0
+        data, digest = result
+        notified = self.source.reload(data)
+        self.source.backend.writer.digest = digest
+        return notified
+
+    def _read(self):
+        backend = self.source.backend
+        try:
+            with open(backend.path, "rb") as file:
+                contents = file.read()
+        except OSError:
+            return None
+        digest = content_digest(contents)
+        if digest == backend.writer.digest:
+            return None  # Written by the data source itself
+
+        serializer = backend.serializer
+        try:
+            if hasattr(serializer, "load_validated"):
+                data = serializer.load_validated(
+                    io.BytesIO(contents), self.source.schema
+                )
+            else:
+                data = serializer.load(contents)
+                self.source.validate_data(data, self.source.schema)
+        except (yaml.YAMLError, SchemaError, ValueError) as e:
+            print(f"Ignoring invalid settings in {backend.path}: {e}")
+            return None
+        return data, digest
@@ -0,0 +1,63 @@
+import os
+
+os.environ.setdefault("TOGA_BACKEND", "toga_dummy")
+
+import pytest  # noqa: E402
+import toga  # noqa: E402
+import yaml  # noqa: E402
+
+from togax_settings.settings import SchemaNodeWidget  # noqa: E402
+
+
+@pytest.fixture(scope="session")
+def app():
+    return toga.App("Settings tests", "org.togax_settings.tests")
+
+
+@pytest.fixture
+def run(app):
+    """Return a function that calls a function on the app's event loop, as
+    building a SettingsTree needs one."""
+
+    def run(function, *args):
+        async def call():
+            return function(*args)
+
+        return app.loop.run_until_complete(call())
+
+    return run
+
+
+@pytest.fixture
+def settings_file(tmp_path):
+    """Return a function that writes a YAML settings file and its path."""
+
+    def write(data, name="settings.yaml"):
+        path = tmp_path / name
+        path.write_text(yaml.safe_dump(data))
+        return str(path)
+
+    return write
+
+
+def read_yaml(path):
+    with open(path) as file:
+        return yaml.safe_load(file)
+
+
+def shown(widget, found=None):
+    """Return the key paths of the nodes a tree shows, in order."""
+    if found is None:
+        found = []
+    for child in getattr(widget, "children", ()):
+        if isinstance(child, SchemaNodeWidget):
+            found.append(child.node.key_path)
+        shown(child, found)
+    return found
+
+
+def tree_paths(node):
+    paths = [node.key_path]
+    for child in node.children:
+        paths.extend(tree_paths(child))
+    return paths
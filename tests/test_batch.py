@@ -0,0 +1,55 @@
+import pytest
+from conftest import shown, tree_paths
+from schema import Optional
+
+from togax_settings import SchemaDataSource, SettingsTree
+
+SCHEMA = {"srv": {Optional(str): {"tags": [int]}}, Optional("name"): str}
+DATA = {"srv": {"a": {"tags": [1]}}, "name": "x"}
+
+
+@pytest.fixture
+def source(app, tmp_path):
+    return SchemaDataSource("t", DATA, SCHEMA, str(tmp_path / "s.yaml"))
+
+
+def test_nested_adds_in_a_batch_create_each_widget_once(source, run):
+    tree = run(SettingsTree, source)
+    with source.batch():
+        source.set("srv.b", {"tags": [0]})
+        source.set("srv.b.tags.1", 1)
+        source.set("srv.b.tags.2", 2)
+
+    paths = shown(tree)
+    assert len(paths) == len(set(paths))
+    assert sorted(paths) == sorted(tree_paths(source))
+    assert [path for path in paths if path[:3] == ("srv", "b", "tags")] == [
+        ("srv", "b", "tags"),
+        ("srv", "b", "tags", 0),
+        ("srv", "b", "tags", 1),
+        ("srv", "b", "tags", 2),
+    ]
+
+
+def test_changes_inside_a_node_removed_in_a_batch_are_dropped(source, run):
+    tree = run(SettingsTree, source)
+    with source.batch():
+        source.set("srv.a.tags.0", 5)
+        source.delete("srv.a")
+
+    assert sorted(shown(tree)) == sorted(tree_paths(source))
+
+
+def test_batch_holds_notifications_until_it_ends(source):
+    seen = []
+
+    class Listener:
+        def source_change_node(self, item):
+            seen.append(item.value)
+
+    source.find("name").add_listener(Listener())
+    with source.batch():
+        source.set("name", "y")
+        source.set("name", "z")
+        assert seen == []
+    assert seen == ["z"]
@@ -0,0 +1,82 @@
+import os
+
+from conftest import read_yaml
+from schema import Optional
+
+from togax_settings import FileBackend, SchemaDataSource
+
+SCHEMA = {"name": str, Optional("ports"): {int: str}}
+
+
+def test_from_backend_without_journal_rewrites_the_file(settings_file):
+    path = settings_file({"name": "a"})
+    source = SchemaDataSource.from_backend("t", FileBackend(path), SCHEMA)
+    assert source.journal is None
+
+    source.set("name", "b")
+
+    assert not os.path.exists(f"{path}.journal")
+    assert read_yaml(path) == {"name": "b"}
+
+
+def test_from_backend_with_journal_appends(settings_file):
+    path = settings_file({"name": "a"})
+    source = SchemaDataSource.from_backend("t", FileBackend(path), SCHEMA, journal=True)
+
+    source.set("name", "b")
+
+    assert os.path.exists(f"{path}.journal")
+    assert read_yaml(path) == {"name": "a"}
+
+
+def test_journal_is_replayed_after_a_crash(settings_file):
+    path = settings_file({"name": "a"})
+    source = SchemaDataSource.from_backend("t", FileBackend(path), SCHEMA, journal=True)
+    source.set("name", "b")
+    source.set("name", "c")
+    # The process dies half way through appending another edit
+    with open(f"{path}.journal", "a") as file:
+        file.write('{"op": "replace", "path": ["na')
+
+    reloaded = SchemaDataSource.from_backend(
+        "t", FileBackend(path), SCHEMA, journal=True
+    )
+
+    assert reloaded.to_dict() == {"name": "c"}
+    # Replayed edits are folded into the file
+    assert read_yaml(path) == {"name": "c"}
+    assert not os.path.exists(f"{path}.journal")
+
+
+def test_journal_left_by_an_interrupted_compaction_is_discarded(settings_file):
+    path = settings_file({"name": "a"})
+    source = SchemaDataSource.from_backend("t", FileBackend(path), SCHEMA, journal=True)
+    source.set("name", "b")
+    with open(f"{path}.journal") as file:
+        journal = file.read()
+    source.save_to_yaml()
+    # The file was rewritten but the process died before clearing the log
+    with open(f"{path}.journal", "w") as file:
+        file.write(journal)
+
+    reloaded = SchemaDataSource.from_backend(
+        "t", FileBackend(path), SCHEMA, journal=True
+    )
+
+    assert reloaded.to_dict() == {"name": "b"}
+    assert not os.path.exists(f"{path}.journal")
+
+
+def test_journal_is_compacted_into_the_file(settings_file):
+    path = settings_file({"name": "a"})
+    source = SchemaDataSource.from_backend(
+        "t", FileBackend(path), SCHEMA, journal=True, compact_every=3
+    )
+    source.set("name", "b")
+    source.set("name", "c")
+    assert read_yaml(path) == {"name": "a"}
+
+    source.set("name", "d")
+
+    assert read_yaml(path) == {"name": "d"}
+    assert not os.path.exists(f"{path}.journal")
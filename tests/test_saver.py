@@ -0,0 +1,33 @@
+import os
+import stat
+
+import pytest
+
+from togax_settings.saver import AtomicWriter
+
+
+@pytest.mark.parametrize("fsync_interval", [0, None])
+def test_write_through_symlink_keeps_the_link(tmp_path, fsync_interval):
+    (tmp_path / "real").mkdir()
+    target = tmp_path / "real" / "settings.yaml"
+    target.write_bytes(b"old\n")
+    target.chmod(0o640)
+    link = tmp_path / "settings.yaml"
+    link.symlink_to(target)
+
+    writer = AtomicWriter(str(link), fsync_interval=fsync_interval)
+    assert writer.write(b"new\n")
+    writer.sync()
+
+    assert link.is_symlink()
+    assert os.readlink(link) == str(target)
+    assert target.read_bytes() == b"new\n"
+    assert stat.S_IMODE(target.stat().st_mode) == 0o640
+    assert sorted(os.listdir(tmp_path / "real")) == ["settings.yaml"]
+    assert not writer.write(b"new\n")
+
+
+def test_write_creates_missing_file(tmp_path):
+    path = tmp_path / "settings.yaml"
+    assert AtomicWriter(str(path)).write(b"a: 1\n")
+    assert path.read_bytes() == b"a: 1\n"
@@ -0,0 +1,73 @@
+import threading
+
+import pytest
+
+from togax_settings import shared
+from togax_settings.shared import Publisher, SharedSettings
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "settings.snapshot")
+
+
+def test_read_overlapped_by_a_growing_write_is_retried(path, monkeypatch):
+    publisher = Publisher(path)
+    publisher.publish({"name": "a"})
+    reader = SharedSettings(path)
+    big = "x" * shared._INITIAL_CAPACITY * 2
+    decode = shared._decode
+    calls = []
+
+    def decode_while_publishing(view, offset):
+        # The first read sees the old snapshot, then a write that grows the
+        # file lands before the reader checks the sequence counter
+        calls.append(offset)
+        value = decode(view, offset)
+        if len(calls) == 1:
+            publisher.publish({"name": big})
+        return value
+
+    monkeypatch.setattr(shared, "_decode", decode_while_publishing)
+
+    assert reader.get("name") == big
+    assert len(calls) == 2
+    assert reader.version == 2
+    reader.close()
+    publisher.close()
+
+
+def test_read_during_a_write_times_out(path):
+    publisher = Publisher(path)
+    publisher.publish({"name": "a"})
+    reader = SharedSettings(path, timeout=0.05)
+    publisher._write_sequence(publisher._sequence + 1)  # Never finished
+
+    with pytest.raises(TimeoutError):
+        reader.get("name")
+    reader.close()
+    publisher.close()
+
+
+def test_reads_are_consistent_while_the_snapshot_grows(path):
+    publisher = Publisher(path)
+    publisher.publish({"items": [0] * 20})
+    reader = SharedSettings(path, timeout=5)
+    done = threading.Event()
+
+    def publish():
+        for count in range(1, 2000, 50):
+            publisher.publish({"items": list(range(count)) * 20})
+        done.set()
+
+    writer = threading.Thread(target=publish)
+    writer.start()
+    try:
+        while not done.is_set():
+            items = reader.get("items")
+            assert items == list(range(len(items) // 20)) * 20
+    finally:
+        writer.join()
+    assert len(reader.get("items")) == 1951 * 20
+    reader.close()
+    publisher.close()
@@ -0,0 +1,63 @@
+import pytest
+from conftest import shown, tree_paths
+from schema import Optional
+
+from togax_settings import SchemaDataSource, SettingsTree
+from togax_settings.settings import SchemaNodeWidget
+
+SCHEMA = {"srv": {Optional(str): {"tags": [int]}}, Optional("name"): str}
+DATA = {"srv": {"a": {"tags": [1]}}, "name": "x"}
+
+
+def shown_values(widget, found=None):
+    """Return the values a tree's leaf widgets show, by key path."""
+    if found is None:
+        found = {}
+    for child in getattr(widget, "children", ()):
+        if isinstance(child, SchemaNodeWidget) and child.value_widget is not None:
+            found[child.node.key_path] = child.value_widget.value
+        shown_values(child, found)
+    return found
+
+
+@pytest.fixture
+def source(app, tmp_path):
+    return SchemaDataSource("t", DATA, SCHEMA, str(tmp_path / "s.yaml"))
+
+
+def test_rollback_restores_data_and_widgets(source, run):
+    tree = run(SettingsTree, source)
+    paths, values = sorted(shown(tree)), shown_values(tree)
+
+    with pytest.raises(RuntimeError):
+        with source.transaction():
+            source.set("name", "y")
+            source.set("srv.a.tags.0", 7)
+            source.set("srv.b", {"tags": [2, 3]})
+            source.delete("srv.a.tags.0")
+            raise RuntimeError
+
+    assert source.to_dict() == DATA
+    assert sorted(tree_paths(source)) == paths
+    assert sorted(shown(tree)) == paths
+    assert shown_values(tree) == values
+
+
+def test_invalid_transaction_is_rolled_back(source):
+    with pytest.raises(ValueError):
+        with source.transaction():
+            source.set("name", "y")
+            source.set("srv.a.tags", ["not an int"])
+
+    assert source.to_dict() == DATA
+    source.validate_changes()
+
+
+def test_reload_only_notifies_changed_nodes(source):
+    name, tags = source.find("name"), source.find("srv.a.tags")
+
+    notified = source.reload({"srv": {"a": {"tags": [1, 2]}}, "name": "x"})
+
+    assert notified == 1
+    assert source.find("name") is name and source.find("srv.a.tags") is tags
+    assert source.to_dict() == {"srv": {"a": {"tags": [1, 2]}}, "name": "x"}
@@ -0,0 +1,40 @@
+import pytest
+from schema import (
+    Optional,
+    Schema,
+    SchemaError,
+    SchemaMissingKeyError,
+    SchemaWrongKeyError,
+)
+
+from togax_settings.validation import _check_keys, match_key
+
+SCHEMA = Schema(
+    {"name": str, Optional("port"): int, Optional(str): object, 1: bool}
+).schema
+
+
+def schema_key(value):
+    return next(skey for skey in SCHEMA if getattr(skey, "_schema", skey) == value)
+
+
+@pytest.mark.parametrize(
+    "key, expected",
+    [("name", "name"), ("port", "port"), ("other", str), (1, 1), (True, 1)],
+)
+def test_match_key_prefers_literals(key, expected):
+    assert match_key(SCHEMA, key) is schema_key(expected)
+
+
+def test_match_key_wrong_key():
+    with pytest.raises(SchemaWrongKeyError):
+        match_key(SCHEMA, 2.5)
+
+
+def test_check_keys_reports_missing_keys_like_schema():
+    with pytest.raises(SchemaMissingKeyError) as ours:
+        _check_keys(SCHEMA, ["port", "other"])
+    with pytest.raises(SchemaError) as theirs:
+        Schema(SCHEMA).validate({"port": 1, "other": 2})
+    assert str(ours.value) == str(theirs.value)
+    _check_keys(SCHEMA, ["name", 1, "port"])
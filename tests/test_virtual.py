@@ -0,0 +1,59 @@
+import pytest
+
+from togax_settings import SchemaDataSource, VirtualSettingsTree
+
+SCHEMA = {"items": [int], "name": str}
+
+
+@pytest.fixture
+def tree(app, run, tmp_path):
+    source = SchemaDataSource(
+        "t",
+        {"items": list(range(300)), "name": "x"},
+        SCHEMA,
+        str(tmp_path / "s.yaml"),
+    )
+    return run(
+        lambda: VirtualSettingsTree(source, page_size=20, row_height=10, expand_depth=2)
+    )
+
+
+def check_rows(tree):
+    source = tree.root_node
+    assert [node for node, _ in tree._rows] == list(_walk(source))
+    shown = len(tree._pool)
+    assert tree._bottom.style.height == (len(tree._rows) - shown) * 10
+
+
+def _walk(node):
+    yield node
+    for child in node.children:
+        yield from _walk(child)
+
+
+def test_rows_cover_every_node(tree):
+    check_rows(tree)
+    assert len(tree._rows) == 303
+
+
+def test_deleting_outside_the_window_updates_the_rows(tree):
+    tree.root_node.delete("items.250")
+    check_rows(tree)
+    assert len(tree._rows) == 302
+
+
+def test_adding_outside_the_window_updates_the_rows(tree):
+    tree.root_node.set("items.300", 7)
+    check_rows(tree)
+    assert tree._rows[-2][0].value == 7
+
+
+def test_reloading_updates_the_rows(tree):
+    tree.root_node.reload({"items": [1, 2], "name": "y"})
+    check_rows(tree)
+    assert len(tree._rows) == 5
+
+
+def test_teardown_stops_listening(tree):
+    tree.teardown()
+    assert not any(tree in node.listeners for node in _walk(tree.root_node))